@@ -0,0 +1,295 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(API_DIR, "test"))
+
+from bland_simulator import BlandSimulator, create_app  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+with open(os.path.join(API_DIR, "test", "data.json"), "r", encoding="UTF-8") as f:
+    PAYLOAD = json.load(f)
+
+WEBHOOK_BODY = {
+    "call_id": "",
+    "status": "completed",
+    "completed": True,
+    "variables": PAYLOAD,
+    "call_length": 3.5,
+    "concatenated_transcript": "assistant: Hi, is this Firestone? \n" * 40,
+    "analysis": {
+        "is_appointment_booked": True,
+        "appointment_time": "2024-08-19 10:00:00",
+    },
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of already sorted values
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_load(url, body_for, requests_count, concurrency, headers_for=lambda i: {}):
+    """
+    Send requests_count POSTs to url from concurrency clients and measure each one
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(i):
+        nonlocal errors
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started_at = time.perf_counter()
+        try:
+            response = local.session.post(
+                url, json=body_for(i), headers=headers_for(i), timeout=60
+            )
+            failed = response.status_code >= 400
+        except requests.exceptions.RequestException:
+            failed = True
+        elapsed = time.perf_counter() - started_at
+        with lock:
+            latencies.append(elapsed)
+            errors += failed
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(requests_count)))
+    duration = time.perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        "requests": requests_count,
+        "errors": errors,
+        "throughput": requests_count / duration,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def max_rss_mb(usage):
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if platform.system() == "Darwin":
+        return usage.ru_maxrss / (1024 * 1024)
+    return usage.ru_maxrss / 1024
+
+
+def run_benchmarks(args):
+    simulator = BlandSimulator(
+        min_duration=3600, max_duration=3600, latency=args.upstream_latency
+    )
+    simulator_port = free_port()
+    simulator_app = create_app(simulator)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    threading.Thread(
+        target=lambda: simulator_app.run(port=simulator_port, threaded=True),
+        daemon=True,
+    ).start()
+
+    app_port = free_port()
+    app_url = f"http://127.0.0.1:{app_port}"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(
+            os.environ,
+            BLAND_API_KEY="bench",
+            BLAND_API_URL=f"http://127.0.0.1:{simulator_port}",
+            LOCAL_URL=app_url,
+            WEBHOOK_DB_PATH=os.path.join(tmp_dir, "bench.db"),
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "flask",
+                "--app",
+                os.path.join(API_DIR, "src", "app"),
+                "run",
+                "--port",
+                str(app_port),
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_up(app_url)
+            wait_until_up(f"http://127.0.0.1:{simulator_port}/v1/calls/none")
+            results = {
+                "/calls/send": run_load(
+                    f"{app_url}/calls/send?phoneNumber=%2B14165550100",
+                    lambda i: dict(PAYLOAD),
+                    args.requests,
+                    args.concurrency,
+                    # a new key per request, so every request places a call
+                    headers_for=lambda i: {"Idempotency-Key": f"bench-{i}"},
+                ),
+                "/calls/call-send": run_load(
+                    f"{app_url}/calls/call-send?phoneNumber=%2B14165550100",
+                    lambda i: dict(PAYLOAD),
+                    args.requests,
+                    args.concurrency,
+                    # a new key per request, so every request places a call
+                    headers_for=lambda i: {"Idempotency-Key": f"bench-{i}"},
+                ),
+                "/webhook/call-received": run_load(
+                    f"{app_url}/webhook/call-received",
+                    lambda i: dict(WEBHOOK_BODY, call_id=f"bench-{i}"),
+                    args.requests,
+                    args.concurrency,
+                ),
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "upstream_latency": args.upstream_latency,
+        },
+        "commit": git_commit(),
+        "server_max_rss_mb": max_rss_mb(resource.getrusage(resource.RUSAGE_CHILDREN)),
+        "routes": results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def baseline_key(config):
+    return (
+        f"requests={config['requests']},concurrency={config['concurrency']},"
+        f"upstream_latency={config['upstream_latency']}"
+    )
+
+
+def compare(report, baseline, tolerance):
+    """
+    List the routes whose throughput dropped or p99 latency grew by more than tolerance
+    """
+    regressions = []
+    for route, result in report["routes"].items():
+        before = baseline["routes"].get(route)
+        if not before:
+            continue
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{route}: throughput {result['throughput']:.1f} req/s "
+                f"(baseline {before['throughput']:.1f})"
+            )
+        if result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{route}: p99 {result['p99_ms']:.1f} ms (baseline {before['p99_ms']:.1f})"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the call dispatch and webhook routes against a simulated Bland API"
+    )
+    parser.add_argument("--requests", type=int, default=500, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--upstream-latency",
+        type=float,
+        default=0.2,
+        help="Seconds the simulated Bland API takes to answer",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed fraction of throughput loss or p99 growth against the baseline",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the baseline for this configuration",
+    )
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    for route, result in report["routes"].items():
+        print(
+            f"{route:<24} {result['throughput']:8.1f} req/s  "
+            f"p50 {result['p50_ms']:7.1f} ms  p90 {result['p90_ms']:7.1f} ms  "
+            f"p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}"
+        )
+    print(f"server max RSS: {report['server_max_rss_mb']:.1f} MB")
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="UTF-8") as f:
+            baselines = json.load(f)
+    key = baseline_key(report["config"])
+
+    if args.save_baseline:
+        baselines[key] = report
+        with open(BASELINE_PATH, "w", encoding="UTF-8") as f:
+            f.write(json.dumps(baselines, indent=2))
+        print(f"Saved baseline for {key}")
+        return
+
+    if key not in baselines:
+        print(f"No baseline for {key}, run with --save-baseline to store one")
+        return
+    regressions = compare(report, baselines[key], args.tolerance)
+    if regressions:
+        print(f"Regressions against baseline from commit {baselines[key]['commit']}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        raise SystemExit(1)
+    print(f"No regressions against baseline from commit {baselines[key]['commit']}")
+
+
+if __name__ == "__main__":
+    main()
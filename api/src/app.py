@@ -1,74 +1,69 @@
-from flask import Flask, request
-import json
-import os
-import requests
-import json
+from flask import Flask, g, request
+import time
+import metrics
+from bland import BlandClient
+from handlers import CallService
+from upstream import retry_after_of
+from calls import pathway_call_data, prompt_call_data
 
 app = Flask(__name__)
+bland = BlandClient()
+service = CallService(bland)
+
+
+def send_call(data):
+    response = bland.send_call(data)
+
+    print("Response:")
+    print(response.text)
+
+    return response.status_code, response.text, retry_after_of(response.headers)
+
+
+@app.before_request
+def start_timer():
+    g.started_at = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    return service.record_request_latency(g.started_at, request, response)
 
 
 @app.route("/webhook/call-received", methods=["POST"])
 def save_call_data():
-    webhook_data = request.get_json()
-    print("Webhook data for call_id=" + webhook_data["call_id"])
-    print(json.dumps(webhook_data))
-    return "Webhook data received"
+    return service.receive_webhook(request.get_json())
+
+# wait for the webhook of a call, answering 204 if it does not arrive before the timeout
+@app.route("/calls/<call_id>/completion", methods=["GET"])
+def call_completion(call_id):
+
+    timeout = service.completion_timeout(request.args)
+
+    webhook_data = service.latest_webhook(call_id)
+    if not webhook_data:
+        webhook_data = service.call_waiters.wait(call_id, timeout)
+
+    return service.completion(webhook_data)
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
 
 # send call using pathway id
 @app.route("/calls/send", methods=["POST"])
 def book_apt():
 
     phone_number = request.args.get("phoneNumber", type=str)
-    pathway_id = (
-        request.args.get("pathwayId", type=str)
-        or "c2e8ce15-655d-4530-8659-d1e1c5d6bd4c"
-    )
+    pathway_id = request.args.get("pathwayId", type=str)
 
     input_data = request.get_json()
 
-    url = "https://api.bland.ai/v1/calls"
-    authorization = os.environ["BLAND_API_KEY"]
-
-    data = {
-        "phone_number": phone_number,
-        "from": None,
-        "task": "",
-        "language": "en",
-        "voice": "nat",
-        "voice_settings": {},
-        "pathway_id": pathway_id,
-        "local_dialing": False,
-        "max_duration": 12,
-        "answered_by_enabled": False,
-        "wait_for_greeting": True,
-        "record": False,
-        "amd": False,
-        "interruption_threshold": 100,
-        "voicemail_message": None,
-        "temperature": None,
-        "transfer_phone_number": None,
-        "transfer_list": {},
-        "metadata": {},
-        "pronunciation_guide": [],
-        "start_time": None,
-        "request_data": input_data,
-        "dynamic_data": [],
-        "webhook": os.environ["LOCAL_URL"] + "/webhook/call-received",
-        "calendly": {},
-        "analysis_schema": {
-            "is_appointment_booked": "boolean",
-            "appointment_time": "YYYY-MM-DD HH:MM:SS",
-        },
-    }
-
-    headers = {"Content-Type": "application/json", "Authorization": authorization}
-
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-
-    print("Response:")
-    print(response.text)
+    key, data, response = service.call_request(
+        request.headers, "/calls/send", pathway_call_data, phone_number, pathway_id, input_data
+    )
 
-    return response.text
+    return response or service.send(key, lambda: send_call(data))
 
 # send call using prompt
 @app.route("/calls/call-send", methods=["POST"])
@@ -77,74 +72,75 @@ def book_apt_v2():
     phone_number = request.args.get("phoneNumber", type=str)
     input_data = request.get_json()
 
-    default_prompt = """
-       You do not need to mention this but for context, you are an AI assistant that will try to book an appointment with a car repair shop. 
-
-        At the start of the call, ask if this number corresponds to {{supplierShopName}}. If it doesn't you can apologize and terminate the call.
-
-        Otherwise, say you are calling on behalf of a fleet company named {{companyName}}.
-
-        Say that you're looking to book an appointment for {{serviceName}} for a {{vehicleYear}} {{vehicleMake}} {{vehicleModel}}. If there is a {{vehicleCustomization}}, mention that too. Ask if the user can service this vehicle. If they can't, then terminate the call politely.
-
-        If they can, ask if they could schedule an appointment on {{firstTimeRange}} or {{secondTimeRange}}
-
-        If they don't have availability during those times then politely terminate the call. If they do have availability during those times, make sure the user gives you a specific time slot (such as 4:00PM ) within the range.
-
-        If you were able to successfully book an appointment then mention the driver's name {{driverFullName}} and their phone number {{driverPhoneNumber}}. Ask the user if they would like you to repeat or spell out that information, and do not ask if it's correct. Once the user is good, thank them and terminate the call.
-
-        If asked about the vehicle color or vehicle plate at any point in the conversation, respond with {{vehicleColor}} and {{vehiclePlate}} correspondingly.
-
-    """
-
-    prompt = input_data.get("prompt", default_prompt)
-    if input_data.get("prompt"):
-        del input_data["prompt"]
-
-    data = {
-        "phone_number": phone_number,
-        "from": None,
-        "task": prompt,
-        "model": "enhanced",
-        "language": "en",
-        "voice": "nat",
-        "voice_settings": {},
-        "pathway_id": None,
-        "local_dialing": False,
-        "max_duration": 12,
-        "answered_by_enabled": False,
-        "wait_for_greeting": True,
-        "record": False,
-        "amd": False,
-        "interruption_threshold": 100,
-        "voicemail_message": None,
-        "temperature": None,
-        "transfer_phone_number": None,
-        "transfer_list": {},
-        "metadata": {},
-        "pronunciation_guide": [],
-        "start_time": None,
-        "request_data": input_data,
-        "tools": [],
-        "dynamic_data": [],
-        "analysis_schema": {
-            "is_appointment_booked": "boolean",
-            "appointment_time": "YYYY-MM-DD HH:MM:SS",
-        },
-        "webhook": os.environ["LOCAL_URL"] + "/webhook/call-received",
-        "calendly": {},
-    }
-
-    headers = {
-        "Authorization": os.environ["BLAND_API_KEY"],
-    }
-
-    url = "https://api.bland.ai/v1/calls"
-    response = requests.post(url, json=data, headers=headers)
+    key, data, response = service.call_request(
+        request.headers, "/calls/call-send", prompt_call_data, phone_number, input_data
+    )
 
-    print("Response:")
-    print(response.text)
+    return response or service.send(key, lambda: send_call(data))
+
+# send many calls concurrently, using a pathway id when given and the prompt otherwise
+@app.route("/calls/batch", methods=["POST"])
+def book_apt_batch():
+
+    input_data = request.get_json()
+
+    error = service.batch_error(input_data)
+    if error:
+        return error
+
+    entries = input_data["calls"]
+
+    calls, results = service.batch_calls(entries)
+
+    return service.batch_response(entries, results, bland.send_calls(calls))
+
+# queue a campaign of calls to be dispatched in the background
+@app.route("/campaigns", methods=["POST"])
+def create_campaign():
+
+    return service.create_campaign(request.get_json())
+
+# call a ranked list of shops, a few at a time, until one books the appointment
+@app.route("/fan-outs", methods=["POST"])
+def create_fan_out():
+
+    return service.create_fan_out(request.get_json())
+
+# get the progress of a fan-out and the shop that booked, if any
+@app.route("/fan-outs/<fan_out_id>", methods=["GET"])
+def get_fan_out(fan_out_id):
+
+    return service.fan_out(fan_out_id)
+
+# get the outcome of a call from its webhook
+@app.route("/calls/<call_id>/outcome", methods=["GET"])
+def get_call_outcome(call_id):
+
+    return service.call_outcome(call_id)
+
+# get the booked appointments on a date, e.g. /bookings?date=2024-08-19
+@app.route("/bookings", methods=["GET"])
+def get_bookings():
+
+    return service.bookings(request.args)
+
+# get the outcome of the latest call to a shop
+@app.route("/shops/<phone_number>/latest", methods=["GET"])
+def get_latest_shop_outcome(phone_number):
+
+    return service.latest_shop_outcome(phone_number)
+
+# list the prompts in the registry with their versions and variables
+@app.route("/prompts", methods=["GET"])
+def get_prompts():
+
+    return service.prompts()
+
+# get the progress of a campaign
+@app.route("/campaigns/<campaign_id>", methods=["GET"])
+def get_campaign(campaign_id):
 
-    return response.text
+    return service.campaign(campaign_id)
 
 
 if __name__ == "__main__":
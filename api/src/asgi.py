@@ -0,0 +1,159 @@
+import asyncio
+import time
+from quart import Quart, g, request
+import metrics
+from bland import BlandClient
+from bland_async import AsyncBlandClient
+from handlers import CallService
+from upstream import retry_after_of
+from calls import pathway_call_data, prompt_call_data
+
+# Same routes as app.py, served asynchronously so in-flight upstream calls and
+# webhook long-polls do not each hold a worker thread
+app = Quart(__name__)
+bland = AsyncBlandClient()
+# campaigns and fan-outs dispatch from their own background threads
+service = CallService(BlandClient())
+
+
+async def send_call(data):
+    response = await bland.send_call(data)
+
+    print("Response:")
+    print(response.text)
+
+    return response.status_code, response.text, retry_after_of(response.headers)
+
+
+@app.after_serving
+async def close_bland_client():
+    await bland.close()
+
+
+@app.before_request
+async def start_timer():
+    g.started_at = time.perf_counter()
+
+
+@app.after_request
+async def record_request_latency(response):
+    return service.record_request_latency(g.started_at, request, response)
+
+
+@app.route("/webhook/call-received", methods=["POST"])
+async def save_call_data():
+    return service.receive_webhook(await request.get_json(), timeout=0)
+
+# wait for the webhook of a call, answering 204 if it does not arrive before the timeout
+@app.route("/calls/<call_id>/completion", methods=["GET"])
+async def call_completion(call_id):
+
+    timeout = service.completion_timeout(request.args)
+
+    webhook_data = await service.call_waiters.wait_async(call_id, 0)
+    if not webhook_data:
+        webhook_data = await asyncio.to_thread(service.webhook_store.latest, call_id)
+    if not webhook_data:
+        webhook_data = await service.call_waiters.wait_async(call_id, timeout)
+
+    return service.completion(webhook_data)
+
+@app.route("/metrics", methods=["GET"])
+async def get_metrics():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+# send call using pathway id
+@app.route("/calls/send", methods=["POST"])
+async def book_apt():
+
+    phone_number = request.args.get("phoneNumber", type=str)
+    pathway_id = request.args.get("pathwayId", type=str)
+
+    input_data = await request.get_json()
+
+    key, data, response = service.call_request(
+        request.headers, "/calls/send", pathway_call_data, phone_number, pathway_id, input_data
+    )
+
+    return response or await service.send_async(key, lambda: send_call(data))
+
+# send call using prompt
+@app.route("/calls/call-send", methods=["POST"])
+async def book_apt_v2():
+
+    phone_number = request.args.get("phoneNumber", type=str)
+    input_data = await request.get_json()
+
+    key, data, response = service.call_request(
+        request.headers, "/calls/call-send", prompt_call_data, phone_number, input_data
+    )
+
+    return response or await service.send_async(key, lambda: send_call(data))
+
+# send many calls concurrently, using a pathway id when given and the prompt otherwise
+@app.route("/calls/batch", methods=["POST"])
+async def book_apt_batch():
+
+    input_data = await request.get_json()
+
+    error = service.batch_error(input_data)
+    if error:
+        return error
+
+    entries = input_data["calls"]
+
+    calls, results = service.batch_calls(entries)
+
+    return service.batch_response(entries, results, await bland.send_calls(calls))
+
+# queue a campaign of calls to be dispatched in the background
+@app.route("/campaigns", methods=["POST"])
+async def create_campaign():
+
+    return service.create_campaign(await request.get_json())
+
+# call a ranked list of shops, a few at a time, until one books the appointment
+@app.route("/fan-outs", methods=["POST"])
+async def create_fan_out():
+
+    return service.create_fan_out(await request.get_json())
+
+# get the progress of a fan-out and the shop that booked, if any
+@app.route("/fan-outs/<fan_out_id>", methods=["GET"])
+async def get_fan_out(fan_out_id):
+
+    return service.fan_out(fan_out_id)
+
+# get the outcome of a call from its webhook
+@app.route("/calls/<call_id>/outcome", methods=["GET"])
+async def get_call_outcome(call_id):
+
+    return await asyncio.to_thread(service.call_outcome, call_id)
+
+# get the booked appointments on a date, e.g. /bookings?date=2024-08-19
+@app.route("/bookings", methods=["GET"])
+async def get_bookings():
+
+    return await asyncio.to_thread(service.bookings, request.args)
+
+# get the outcome of the latest call to a shop
+@app.route("/shops/<phone_number>/latest", methods=["GET"])
+async def get_latest_shop_outcome(phone_number):
+
+    return await asyncio.to_thread(service.latest_shop_outcome, phone_number)
+
+# list the prompts in the registry with their versions and variables
+@app.route("/prompts", methods=["GET"])
+async def get_prompts():
+
+    return service.prompts()
+
+# get the progress of a campaign
+@app.route("/campaigns/<campaign_id>", methods=["GET"])
+async def get_campaign(campaign_id):
+
+    return service.campaign(campaign_id)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0")
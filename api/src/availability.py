@@ -0,0 +1,126 @@
+from datetime import datetime
+from functools import lru_cache
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class NoOverlap(ValueError):
+    """
+    Raised when the driver's time ranges and the shop's availability do not overlap
+    """
+
+
+class InvalidTimeRange(ValueError):
+    """
+    Raised when the driver's time ranges or the shop's availability cannot be parsed
+    """
+
+
+@lru_cache(maxsize=4096)
+def parse_range(range_str):
+    """
+    Parse a time range like "2024-08-19 9:00:00 - 12:00:00" into (start, end) datetimes
+    """
+    try:
+        date_range, time_range = range_str.strip().split(" ", 1)
+        start_time_str, end_time_str = time_range.split(" - ")
+        start = datetime.strptime(f"{date_range} {start_time_str}", DATETIME_FORMAT)
+        end = datetime.strptime(f"{date_range} {end_time_str}", DATETIME_FORMAT)
+    except ValueError:
+        raise InvalidTimeRange(
+            f'Invalid time range "{range_str}", expected a range like '
+            '"2024-08-19 9:00:00 - 12:00:00"'
+        ) from None
+    if end < start:
+        raise InvalidTimeRange(f"Time range ends before it starts: {range_str}")
+    return start, end
+
+
+def format_range(interval):
+    """
+    Format (start, end) back into a time range like "2024-08-19 9:00:00 - 12:00:00"
+    """
+    start, end = interval
+    return f"{start:%Y-%m-%d} {start.hour}:{start:%M:%S} - {end.hour}:{end:%M:%S}"
+
+
+def parse_ranges(range_strs):
+    """
+    Parse time ranges into a sorted list of non-overlapping (start, end) intervals
+    """
+    intervals = sorted(parse_range(range_str) for range_str in range_strs)
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def intersect(intervals, other_intervals):
+    """
+    Intersect two sorted lists of non-overlapping intervals in a single sweep
+    """
+    overlaps = []
+    i = j = 0
+    while i < len(intervals) and j < len(other_intervals):
+        start = max(intervals[i][0], other_intervals[j][0])
+        end = min(intervals[i][1], other_intervals[j][1])
+        if start < end:
+            overlaps.append((start, end))
+        if intervals[i][1] < other_intervals[j][1]:
+            i += 1
+        else:
+            j += 1
+    return overlaps
+
+
+def candidate_slots(driver_ranges, shop_ranges):
+    """
+    Time ranges in which both the driver and the shop are available
+    """
+    overlaps = intersect(parse_ranges(driver_ranges), parse_ranges(shop_ranges))
+    return [format_range(overlap) for overlap in overlaps]
+
+
+def with_candidate_slots(input_data):
+    """
+    When input_data has the shop's availability ("shopAvailability"), replace it
+    with the slots that also fit the driver's time ranges ("candidateSlots").
+    Raises NoOverlap when there are none, so the call can be skipped, and
+    InvalidTimeRange when a range cannot be parsed. Without driver time ranges
+    the shop's availability is passed on as the slots.
+    """
+    if "shopAvailability" not in input_data:
+        return input_data
+    input_data = dict(input_data)
+    shop_ranges = input_data.pop("shopAvailability")
+    if not isinstance(shop_ranges, list) or not all(
+        isinstance(range_str, str) for range_str in shop_ranges
+    ):
+        raise InvalidTimeRange(
+            "shopAvailability must be a list of time ranges like "
+            '"2024-08-19 9:00:00 - 12:00:00"'
+        )
+    driver_ranges = []
+    for key in ("firstTimeRange", "secondTimeRange"):
+        if not input_data.get(key):
+            continue
+        if not isinstance(input_data[key], str):
+            raise InvalidTimeRange(
+                f'{key} must be a time range like "2024-08-19 9:00:00 - 12:00:00"'
+            )
+        driver_ranges.append(input_data[key])
+    if not driver_ranges:
+        slots = [format_range(interval) for interval in parse_ranges(shop_ranges)]
+        if slots:
+            input_data["candidateSlots"] = "; ".join(slots)
+        return input_data
+    slots = candidate_slots(driver_ranges, shop_ranges)
+    if not slots:
+        raise NoOverlap(
+            "The shop has no availability within the driver's time ranges"
+        )
+    input_data["candidateSlots"] = "; ".join(slots)
+    return input_data
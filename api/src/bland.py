@@ -0,0 +1,129 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+from upstream import UpstreamGate, UpstreamUnavailable, outcome_of, retry_after_of
+
+BLAND_API_URL = os.environ.get("BLAND_API_URL", "https://api.bland.ai")
+BLAND_TIMEOUT = float(os.environ.get("BLAND_TIMEOUT", "30"))
+BLAND_MAX_RETRIES = int(os.environ.get("BLAND_MAX_RETRIES", "2"))
+
+
+class BlandClient:
+    """
+    Bland API client sharing one keep-alive connection pool across requests.
+    Calls go through an UpstreamGate, and calls rejected with a 429 are sent
+    again (up to max_retries times) once Retry-After has passed.
+    """
+
+    def __init__(self, base_url=BLAND_API_URL, max_workers=None, max_retries=None):
+        self.calls_url = base_url + "/v1/calls"
+        self.max_workers = max_workers or int(
+            os.environ.get("BLAND_MAX_CONCURRENCY", "16")
+        )
+        self.max_retries = BLAND_MAX_RETRIES if max_retries is None else max_retries
+        self.gate = UpstreamGate("sync", max_limit=self.max_workers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send_call(self, data):
+        """
+        Place a single call with the given Bland call payload. Raises
+        UpstreamUnavailable when the gate does not let the call through.
+        """
+        response = self._post_call(data)
+        for _ in range(self.max_retries):
+            if response.status_code != 429:
+                break
+            try:
+                response = self._post_call(data)
+            except UpstreamUnavailable:
+                break
+        return response
+
+    def _post_call(self, data):
+        headers = {"Authorization": os.environ["BLAND_API_KEY"]}
+        self.gate.acquire()
+        # requests interrupted before an answer (e.g. cancelled) only free their slot
+        outcome, retry_after = "interrupted", None
+        started_at = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.calls_url, json=data, headers=headers, timeout=BLAND_TIMEOUT
+            )
+            outcome = outcome_of(response.status_code)
+            retry_after = retry_after_of(response.headers)
+        except requests.exceptions.RequestException:
+            metrics.UPSTREAM_RESPONSES.inc(endpoint="/v1/calls", status="error")
+            outcome = "failed"
+            raise
+        finally:
+            latency = time.perf_counter() - started_at
+            metrics.UPSTREAM_LATENCY.observe(latency, endpoint="/v1/calls")
+            self.gate.release(outcome, latency, retry_after)
+        metrics.UPSTREAM_RESPONSES.inc(
+            endpoint="/v1/calls", status=response.status_code
+        )
+        if response.status_code == 200:
+            try:
+                metrics.CALLS.dispatched(response.json()["call_id"])
+            except (ValueError, KeyError):
+                pass
+        return response
+
+    def get_call(self, call_id):
+        """
+        Details of a call, including its analysis once Bland has made it
+        """
+        return self._request("GET", f"{self.calls_url}/{call_id}", "/v1/calls/{call_id}")
+
+    def stop_call(self, call_id):
+        """
+        End an ongoing call right away
+        """
+        return self._request(
+            "POST", f"{self.calls_url}/{call_id}/stop", "/v1/calls/{call_id}/stop"
+        )
+
+    def _request(self, method, url, endpoint):
+        headers = {"Authorization": os.environ["BLAND_API_KEY"]}
+        started_at = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, url, headers=headers, timeout=BLAND_TIMEOUT
+            )
+        except requests.exceptions.RequestException:
+            metrics.UPSTREAM_RESPONSES.inc(endpoint=endpoint, status="error")
+            raise
+        finally:
+            metrics.UPSTREAM_LATENCY.observe(
+                time.perf_counter() - started_at, endpoint=endpoint
+            )
+        metrics.UPSTREAM_RESPONSES.inc(endpoint=endpoint, status=response.status_code)
+        return response
+
+    def send_calls(self, calls):
+        """
+        Place many calls with bounded concurrency, returning one result per payload
+        in the same order: {"call_id": ...} on success or {"error": ...} on failure
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self._send_call_result, calls))
+
+    def _send_call_result(self, data):
+        try:
+            response = self.send_call(data)
+        except (requests.exceptions.RequestException, UpstreamUnavailable) as e:
+            return {"error": str(e)}
+        try:
+            body = response.json()
+        except ValueError:
+            return {"error": response.text}
+        if response.status_code != 200 or not body.get("call_id"):
+            return {"error": body.get("message") or body.get("errors") or body}
+        return {"call_id": body["call_id"]}
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import time
+import httpx
+import metrics
+from bland import BLAND_API_URL, BLAND_MAX_RETRIES, BLAND_TIMEOUT
+from upstream import UpstreamGate, UpstreamUnavailable, outcome_of, retry_after_of
+
+
+class AsyncBlandClient:
+    """
+    Non-blocking Bland API client sharing one keep-alive connection pool, with
+    the same gate and 429 retries as BlandClient
+    """
+
+    def __init__(self, base_url=BLAND_API_URL, max_connections=None, max_retries=None):
+        self.max_connections = max_connections or int(
+            os.environ.get("BLAND_MAX_CONNECTIONS", "1000")
+        )
+        self.max_workers = int(os.environ.get("BLAND_MAX_CONCURRENCY", "16"))
+        self.max_retries = BLAND_MAX_RETRIES if max_retries is None else max_retries
+        self.gate = UpstreamGate("async", max_limit=self.max_connections)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+            timeout=httpx.Timeout(BLAND_TIMEOUT),
+        )
+
+    async def send_call(self, data):
+        """
+        Place a single call with the given Bland call payload. Raises
+        UpstreamUnavailable when the gate does not let the call through.
+        """
+        response = await self._post_call(data)
+        for _ in range(self.max_retries):
+            if response.status_code != 429:
+                break
+            try:
+                response = await self._post_call(data)
+            except UpstreamUnavailable:
+                break
+        return response
+
+    async def _post_call(self, data):
+        headers = {"Authorization": os.environ["BLAND_API_KEY"]}
+        await self.gate.acquire_async()
+        # requests interrupted before an answer (e.g. cancelled) only free their slot
+        outcome, retry_after = "interrupted", None
+        started_at = time.perf_counter()
+        try:
+            response = await self.client.post("/v1/calls", json=data, headers=headers)
+            outcome = outcome_of(response.status_code)
+            retry_after = retry_after_of(response.headers)
+        except httpx.HTTPError:
+            metrics.UPSTREAM_RESPONSES.inc(endpoint="/v1/calls", status="error")
+            outcome = "failed"
+            raise
+        finally:
+            latency = time.perf_counter() - started_at
+            metrics.UPSTREAM_LATENCY.observe(latency, endpoint="/v1/calls")
+            self.gate.release(outcome, latency, retry_after)
+        metrics.UPSTREAM_RESPONSES.inc(
+            endpoint="/v1/calls", status=response.status_code
+        )
+        if response.status_code == 200:
+            try:
+                metrics.CALLS.dispatched(response.json()["call_id"])
+            except (ValueError, KeyError):
+                pass
+        return response
+
+    async def send_calls(self, calls):
+        """
+        Place many calls with at most max_workers at once, returning one result per
+        payload in the same order: {"call_id": ...} on success or {"error": ...} on failure
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def send_call_result(data):
+            async with semaphore:
+                return await self._send_call_result(data)
+
+        return list(await asyncio.gather(*map(send_call_result, calls)))
+
+    async def _send_call_result(self, data):
+        try:
+            response = await self.send_call(data)
+        except (httpx.HTTPError, UpstreamUnavailable) as e:
+            return {"error": str(e)}
+        try:
+            body = response.json()
+        except ValueError:
+            return {"error": response.text}
+        if response.status_code != 200 or not body.get("call_id"):
+            return {"error": body.get("message") or body.get("errors") or body}
+        return {"call_id": body["call_id"]}
+
+    async def close(self):
+        await self.client.aclose()
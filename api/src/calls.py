@@ -0,0 +1,105 @@
+import os
+from availability import with_candidate_slots
+from prompt_registry import PROMPTS
+
+DEFAULT_PATHWAY_ID = "c2e8ce15-655d-4530-8659-d1e1c5d6bd4c"
+
+
+def pathway_call_data(phone_number, pathway_id, input_data):
+    return {
+        "phone_number": phone_number,
+        "from": None,
+        "task": "",
+        "language": "en",
+        "voice": "nat",
+        "voice_settings": {},
+        "pathway_id": pathway_id or DEFAULT_PATHWAY_ID,
+        "local_dialing": False,
+        "max_duration": 12,
+        "answered_by_enabled": False,
+        "wait_for_greeting": True,
+        "record": False,
+        "amd": False,
+        "interruption_threshold": 100,
+        "voicemail_message": None,
+        "temperature": None,
+        "transfer_phone_number": None,
+        "transfer_list": {},
+        "metadata": {},
+        "pronunciation_guide": [],
+        "start_time": None,
+        "request_data": with_candidate_slots(input_data),
+        "dynamic_data": [],
+        "webhook": os.environ["LOCAL_URL"] + "/webhook/call-received",
+        "calendly": {},
+        "analysis_schema": {
+            "is_appointment_booked": "boolean",
+            "appointment_time": "YYYY-MM-DD HH:MM:SS",
+        },
+    }
+
+
+def prompt_call_data(phone_number, input_data):
+    # a prompt given in full, otherwise one from the registry by name and version
+    prompt = input_data.pop("prompt", None)
+    prompt_name = input_data.pop("promptName", None)
+    prompt_version = input_data.pop("promptVersion", None)
+    if not prompt:
+        prompt = PROMPTS.get(prompt_name, prompt_version).text
+
+    return {
+        "phone_number": phone_number,
+        "from": None,
+        "task": prompt,
+        "model": "enhanced",
+        "language": "en",
+        "voice": "nat",
+        "voice_settings": {},
+        "pathway_id": None,
+        "local_dialing": False,
+        "max_duration": 12,
+        "answered_by_enabled": False,
+        "wait_for_greeting": True,
+        "record": False,
+        "amd": False,
+        "interruption_threshold": 100,
+        "voicemail_message": None,
+        "temperature": None,
+        "transfer_phone_number": None,
+        "transfer_list": {},
+        "metadata": {},
+        "pronunciation_guide": [],
+        "start_time": None,
+        "request_data": with_candidate_slots(input_data),
+        "tools": [],
+        "dynamic_data": [],
+        "analysis_schema": {
+            "is_appointment_booked": "boolean",
+            "appointment_time": "YYYY-MM-DD HH:MM:SS",
+        },
+        "webhook": os.environ["LOCAL_URL"] + "/webhook/call-received",
+        "calendly": {},
+    }
+
+
+def entry_call_data(entry):
+    # batch and campaign entries use a pathway when given one and the prompt otherwise
+    input_data = dict(entry.get("data", {}))
+    if "pathwayId" in entry:
+        return pathway_call_data(entry["phoneNumber"], entry["pathwayId"], input_data)
+    return prompt_call_data(entry["phoneNumber"], input_data)
+
+
+def entry_error(entry):
+    """
+    Why a batch, campaign or fan-out entry cannot be called, or None if it can
+    """
+    if not isinstance(entry, dict):
+        return "Each call must be an object"
+    if not isinstance(entry.get("phoneNumber"), str) or not entry["phoneNumber"]:
+        return "phoneNumber is required"
+    if not isinstance(entry.get("data", {}), dict):
+        return "data must be an object"
+    if not isinstance(entry.get("pathwayId", ""), str):
+        return "pathwayId must be a string"
+    return None
@@ -0,0 +1,313 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import requests
+from availability import NoOverlap
+from calls import entry_error
+from upstream import UpstreamUnavailable
+
+
+def next_calling_time(calling_hours, now=None):
+    """
+    Return None if now is within the calling hours, otherwise the datetime at
+    which they next open. calling_hours looks like
+    {"start": "09:00", "end": "17:00", "timezone": "America/Toronto"}.
+    """
+    timezone = ZoneInfo(calling_hours.get("timezone", "UTC"))
+    now = (now or datetime.now(timezone)).astimezone(timezone)
+    start = datetime.strptime(calling_hours["start"], "%H:%M").time()
+    end = datetime.strptime(calling_hours["end"], "%H:%M").time()
+    if start <= now.time() < end:
+        return None
+    opening = now.replace(
+        hour=start.hour, minute=start.minute, second=0, microsecond=0
+    )
+    if now.time() >= end:
+        opening += timedelta(days=1)
+    return opening
+
+
+def positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def campaign_error(input_data):
+    """
+    Why a campaign request cannot be queued, or None if it can
+    """
+    if not isinstance(input_data, dict):
+        return "The body must be a JSON object"
+    calls = input_data.get("calls")
+    if not isinstance(calls, list):
+        return "calls must be a list"
+    for position, entry in enumerate(calls):
+        error = entry_error(entry)
+        if error:
+            return f"calls[{position}]: {error}"
+    priority = input_data.get("priority", 0)
+    if not isinstance(priority, (int, float)) or isinstance(priority, bool):
+        return "priority must be a number"
+    if input_data.get("maxConcurrency") is not None and not positive_int(
+        input_data["maxConcurrency"]
+    ):
+        return "maxConcurrency must be a positive integer"
+    if not positive_int(input_data.get("maxAttempts", 3)):
+        return "maxAttempts must be a positive integer"
+    calling_hours = input_data.get("callingHours")
+    if calling_hours is not None:
+        try:
+            next_calling_time(calling_hours)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return (
+                'callingHours must look like {"start": "09:00", "end": "17:00", '
+                '"timezone": "America/Toronto"}'
+            )
+    return None
+
+
+def format_start_time(moment):
+    """
+    Format a datetime the way Bland expects start_time, e.g. 2024-08-19 09:00:00 -04:00
+    """
+    offset = moment.strftime("%z")
+    return moment.strftime("%Y-%m-%d %H:%M:%S ") + offset[:3] + ":" + offset[3:]
+
+
+class Campaign:
+    """
+    A batch of calls dispatched in the background, with its own priority,
+    concurrency cap and calling hours
+    """
+
+    def __init__(self, entries, priority, max_concurrency, calling_hours, max_attempts):
+        self.id = str(uuid.uuid4())
+        self.entries = entries
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.calling_hours = calling_hours
+        self.max_attempts = max_attempts
+        self.in_flight = 0
+        self.created_at = time.time()
+        # calls not yet dispatched, failed or skipped
+        self.remaining = len(entries)
+        # indices of the calls waiting to be dispatched, in order
+        self.queue = deque(range(len(entries)))
+        # whether the campaign is in the scheduler's ready heap
+        self.scheduled = False
+        self.sequence = 0
+        self.calls = [
+            {
+                "phoneNumber": entry["phoneNumber"],
+                "status": "pending",
+                "attempts": 0,
+                "call_id": None,
+                "start_time": None,
+                "error": None,
+            }
+            for entry in entries
+        ]
+
+    def progress(self):
+        counts = {"pending": 0, "dispatched": 0, "failed": 0, "skipped": 0}
+        for call in self.calls:
+            counts[call["status"]] += 1
+        return {
+            "campaign_id": self.id,
+            "status": "running" if counts["pending"] else "completed",
+            "total": len(self.calls),
+            **counts,
+            "calls": [dict(call) for call in self.calls],
+        }
+
+
+class CampaignScheduler:
+    """
+    Dispatches campaign calls from a priority queue on a pool of workers.
+    Higher priority campaigns go first, each campaign has at most
+    max_concurrency calls being dispatched at once, calls outside the
+    campaign's calling hours are sent with Bland's start_time set to the next
+    opening, and failed dispatches are retried with exponential backoff.
+
+    Each campaign queues its own calls, and only campaigns with calls waiting
+    and room under their cap are in the priority queue, so each dispatch costs
+    O(log campaigns) however many calls are capped. Completed campaigns are
+    forgotten ttl seconds after their last call.
+    """
+
+    def __init__(
+        self, client, build_call, max_workers=None, retry_backoff=None, ttl=None
+    ):
+        self.client = client
+        self.build_call = build_call
+        self.max_workers = max_workers or client.max_workers
+        self.retry_backoff = retry_backoff or float(
+            os.environ.get("CAMPAIGN_RETRY_BACKOFF", "30")
+        )
+        self.ttl = ttl or float(os.environ.get("CAMPAIGN_TTL", "86400"))
+        self.campaigns = {}
+        # (completed_at, campaign_id) in the order campaigns completed
+        self._completed = deque()
+        self._ready = []
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._thread = None
+
+    def submit(
+        self,
+        entries,
+        priority=0,
+        max_concurrency=None,
+        calling_hours=None,
+        max_attempts=3,
+    ):
+        """
+        Queue a campaign and return its id right away. The request is expected
+        to have passed campaign_error.
+        """
+        campaign = Campaign(
+            entries,
+            priority,
+            max_concurrency or self.max_workers,
+            calling_hours,
+            max_attempts,
+        )
+        with self._condition:
+            self._evict()
+            campaign.sequence = next(self._sequence)
+            self._schedule(campaign)
+            # only registered once it is queued, so it cannot be left running
+            self.campaigns[campaign.id] = campaign
+            if not campaign.remaining:
+                self._completed.append((time.monotonic(), campaign.id))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return campaign.id
+
+    def progress(self, campaign_id):
+        with self._condition:
+            self._evict()
+            campaign = self.campaigns.get(campaign_id)
+            return campaign.progress() if campaign else None
+
+    def _evict(self):
+        # called with the lock held
+        expired = time.monotonic() - self.ttl
+        while self._completed and self._completed[0][0] < expired:
+            self.campaigns.pop(self._completed.popleft()[1], None)
+
+    def _call_done(self, campaign):
+        # called with the lock held, when a call is dispatched, failed or skipped
+        campaign.remaining -= 1
+        if not campaign.remaining:
+            self._completed.append((time.monotonic(), campaign.id))
+
+    def _schedule(self, campaign):
+        # put the campaign in the ready heap if it can dispatch another call
+        if (
+            campaign.queue
+            and not campaign.scheduled
+            and campaign.in_flight < campaign.max_concurrency
+        ):
+            campaign.scheduled = True
+            heapq.heappush(
+                self._ready, (-campaign.priority, campaign.sequence, campaign)
+            )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, campaign, index = heapq.heappop(self._delayed)
+                    campaign.queue.append(index)
+                    self._schedule(campaign)
+
+                while self._ready and self._in_flight < self.max_workers:
+                    campaign = heapq.heappop(self._ready)[2]
+                    campaign.scheduled = False
+                    index = campaign.queue.popleft()
+                    campaign.in_flight += 1
+                    self._in_flight += 1
+                    self._executor.submit(self._dispatch, campaign, index)
+                    self._schedule(campaign)
+
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._condition.wait(timeout)
+
+    def _dispatch(self, campaign, index):
+        call = campaign.calls[index]
+        try:
+            data = self.build_call(campaign.entries[index])
+            if campaign.calling_hours:
+                opening = next_calling_time(campaign.calling_hours)
+                if opening:
+                    data["start_time"] = format_start_time(opening)
+        except NoOverlap as e:
+            with self._condition:
+                campaign.in_flight -= 1
+                self._in_flight -= 1
+                call.update(status="skipped", error=str(e))
+                self._call_done(campaign)
+                self._schedule(campaign)
+                self._condition.notify()
+            return
+        except (LookupError, TypeError, ValueError) as e:
+            data = {}
+            error, body, retryable, retry_after = f"Invalid call: {e}", {}, False, None
+        else:
+            error, body, retryable, retry_after = self._send(data)
+
+        with self._condition:
+            campaign.in_flight -= 1
+            self._in_flight -= 1
+            call["attempts"] += 1
+            if not error:
+                call.update(
+                    status="dispatched",
+                    call_id=body["call_id"],
+                    start_time=data.get("start_time"),
+                    error=None,
+                )
+                self._call_done(campaign)
+            elif retryable and call["attempts"] < campaign.max_attempts:
+                call["error"] = str(error)
+                backoff = retry_after or self.retry_backoff * 2 ** (call["attempts"] - 1)
+                heapq.heappush(
+                    self._delayed,
+                    (time.monotonic() + backoff, next(self._sequence), campaign, index),
+                )
+            else:
+                call.update(status="failed", error=str(error))
+                self._call_done(campaign)
+            self._schedule(campaign)
+            self._condition.notify()
+
+    def _send(self, data):
+        """
+        Place a call, returning (error, body, retryable, retry_after)
+        """
+        try:
+            response = self.client.send_call(data)
+            body = response.json()
+        except UpstreamUnavailable as e:
+            return str(e), {}, True, e.retry_after
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return str(e), {}, True, None
+        if response.status_code == 200 and body.get("call_id"):
+            return None, body, False, None
+        error = body.get("message") or body.get("errors") or response.text
+        retryable = response.status_code == 429 or response.status_code >= 500
+        retry_after = response.headers.get("Retry-After", "")
+        return error, body, retryable, int(retry_after) if retry_after.isdigit() else None
@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from availability import NoOverlap
+from calls import entry_error
+from upstream import UpstreamUnavailable
+
+
+def fan_out_error(input_data):
+    """
+    Why a fan-out request cannot be started, or None if it can
+    """
+    if not isinstance(input_data, dict):
+        return "The body must be a JSON object"
+    shops = input_data.get("shops")
+    if not isinstance(shops, list):
+        return "shops must be a list"
+    for position, shop in enumerate(shops):
+        error = entry_error(shop)
+        if error:
+            return f"shops[{position}]: {error}"
+    if not isinstance(input_data.get("data", {}), dict):
+        return "data must be an object"
+    if not isinstance(input_data.get("pathwayId", ""), str):
+        return "pathwayId must be a string"
+    max_concurrency = input_data.get("maxConcurrency", 3)
+    if (
+        not isinstance(max_concurrency, int)
+        or isinstance(max_concurrency, bool)
+        or max_concurrency < 1
+    ):
+        return "maxConcurrency must be a positive integer"
+    return None
+
+
+class FanOut:
+    """
+    Calls to a ranked list of shops for the same booking, at most
+    max_concurrency at a time, until one of them books the appointment
+    """
+
+    def __init__(self, shops, data, pathway_id, max_concurrency):
+        self.id = str(uuid.uuid4())
+        self.max_concurrency = max_concurrency
+        self.created_at = time.time()
+        self.winner = None
+        self.next_index = 0
+        self.completed = False
+        self.entries = []
+        for shop in shops:
+            entry = {
+                "phoneNumber": shop["phoneNumber"],
+                "data": {**data, **shop.get("data", {})},
+            }
+            if pathway_id:
+                entry["pathwayId"] = pathway_id
+            self.entries.append(entry)
+        self.calls = [
+            {
+                "phoneNumber": entry["phoneNumber"],
+                "status": "pending",
+                "call_id": None,
+                "appointment_time": None,
+                "error": None,
+            }
+            for entry in self.entries
+        ]
+
+    def in_flight(self):
+        return sum(call["status"] in ("dialing", "in-progress") for call in self.calls)
+
+    def status(self):
+        if self.winner is not None:
+            return "booked"
+        if self.next_index < len(self.calls) or self.in_flight():
+            return "running"
+        return "not_booked"
+
+    def progress(self):
+        winner = self.calls[self.winner] if self.winner is not None else None
+        return {
+            "fan_out_id": self.id,
+            "status": self.status(),
+            "winner": dict(winner) if winner else None,
+            "calls": [dict(call) for call in self.calls],
+        }
+
+
+class FanOutScheduler:
+    """
+    Runs fan-outs in the background. The next shops in line are dialed as
+    earlier calls end without a booking; once a call books, the shops still
+    being called are hung up on and the rest are skipped. Bookings are read
+    from each call's webhook, or from Bland for up to analysis_timeout seconds
+    when the webhook arrives before the analysis. A call whose webhook has not
+    arrived call_timeout seconds after it was placed is read from Bland too.
+    lookup_webhook(call_id) finds webhooks that arrived while the call was
+    still being placed. Fan-outs are forgotten ttl seconds after they end.
+    """
+
+    def __init__(
+        self,
+        client,
+        build_call,
+        analysis_timeout=None,
+        call_timeout=None,
+        lookup_webhook=None,
+        ttl=None,
+    ):
+        self.client = client
+        self.build_call = build_call
+        self.analysis_timeout = analysis_timeout or float(
+            os.environ.get("FAN_OUT_ANALYSIS_TIMEOUT", "60")
+        )
+        # calls last at most 12 minutes (max_duration in calls.py)
+        self.call_timeout = call_timeout or float(
+            os.environ.get("FAN_OUT_CALL_TIMEOUT", "900")
+        )
+        self.lookup_webhook = lookup_webhook
+        self.ttl = ttl or float(os.environ.get("FAN_OUT_TTL", "86400"))
+        self.fan_outs = {}
+        # (completed_at, fan_out_id) in the order fan-outs ended
+        self._completed = deque()
+        self._calls = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=client.max_workers)
+
+    def submit(self, shops, data, pathway_id=None, max_concurrency=3):
+        """
+        Start calling the shops, in order, and return the fan-out id right away.
+        The request is expected to have passed fan_out_error.
+        """
+        fan_out = FanOut(shops, data, pathway_id, max_concurrency)
+        with self._lock:
+            self._evict()
+            self.fan_outs[fan_out.id] = fan_out
+        self._advance(fan_out)
+        return fan_out.id
+
+    def progress(self, fan_out_id):
+        with self._lock:
+            self._evict()
+            fan_out = self.fan_outs.get(fan_out_id)
+            return fan_out.progress() if fan_out else None
+
+    def webhook_received(self, webhook_data):
+        """
+        Handle the webhook of a call if it belongs to a running fan-out
+        """
+        with self._lock:
+            if webhook_data.get("call_id") not in self._calls:
+                return False
+        self._executor.submit(self._call_ended, webhook_data)
+        return True
+
+    def _evict(self):
+        # called with the lock held
+        expired = time.monotonic() - self.ttl
+        while self._completed and self._completed[0][0] < expired:
+            self.fan_outs.pop(self._completed.popleft()[1], None)
+
+    def _advance(self, fan_out):
+        with self._lock:
+            indices = []
+            while (
+                fan_out.winner is None
+                and fan_out.next_index < len(fan_out.calls)
+                and fan_out.in_flight() < fan_out.max_concurrency
+            ):
+                fan_out.calls[fan_out.next_index]["status"] = "dialing"
+                indices.append(fan_out.next_index)
+                fan_out.next_index += 1
+            if not fan_out.completed and fan_out.status() != "running":
+                fan_out.completed = True
+                self._completed.append((time.monotonic(), fan_out.id))
+        for index in indices:
+            self._executor.submit(self._dispatch, fan_out, index)
+
+    def _dispatch(self, fan_out, index):
+        call = fan_out.calls[index]
+        error, stop = None, False
+        try:
+            response = self.client.send_call(self.build_call(fan_out.entries[index]))
+            body = response.json()
+            call_id = body.get("call_id")
+            if response.status_code != 200 or not call_id:
+                error = body.get("message") or body.get("errors") or response.text
+        except NoOverlap as e:
+            with self._lock:
+                call.update(status="skipped", error=str(e))
+            self._advance(fan_out)
+            return
+        except (
+            requests.exceptions.RequestException,
+            UpstreamUnavailable,
+            LookupError,
+            TypeError,
+            ValueError,
+        ) as e:
+            error = str(e)
+
+        with self._lock:
+            if error:
+                call.update(status="failed", error=str(error))
+            else:
+                call["call_id"] = call_id
+                call["status"] = "in-progress"
+                self._calls[call_id] = (fan_out, index)
+                # another shop booked while this one was being dialed
+                stop = fan_out.winner is not None
+        if stop:
+            self._stop(fan_out, index)
+        elif not error:
+            self._watch(call_id)
+        self._advance(fan_out)
+
+    def _watch(self, call_id):
+        """
+        Make sure the end of a call is noticed: its webhook may have arrived
+        before the call was registered, or may never arrive
+        """
+        timer = threading.Timer(self.call_timeout, self._call_timed_out, (call_id,))
+        timer.daemon = True
+        with self._lock:
+            if call_id not in self._calls:
+                return
+            self._timers[call_id] = timer
+        timer.start()
+        webhook_data = self.lookup_webhook(call_id) if self.lookup_webhook else None
+        if webhook_data:
+            self._executor.submit(self._call_ended, webhook_data)
+
+    def _call_timed_out(self, call_id):
+        # no webhook in time: read the analysis from Bland instead
+        self._call_ended({"call_id": call_id})
+
+    def _forget(self, call_id):
+        # called with the lock held
+        self._calls.pop(call_id, None)
+        timer = self._timers.pop(call_id, None)
+        if timer:
+            timer.cancel()
+
+    def _call_ended(self, webhook_data):
+        call_id = webhook_data["call_id"]
+        with self._lock:
+            if call_id not in self._calls:
+                return
+        analysis = webhook_data.get("analysis") or self._fetch_analysis(call_id)
+        booked = bool(analysis and analysis.get("is_appointment_booked"))
+
+        to_stop = []
+        with self._lock:
+            if call_id not in self._calls:
+                return
+            fan_out, index = self._calls[call_id]
+            self._forget(call_id)
+            call = fan_out.calls[index]
+            if booked:
+                call.update(
+                    status="booked", appointment_time=analysis.get("appointment_time")
+                )
+            else:
+                call["status"] = "not_booked"
+            if booked and fan_out.winner is None:
+                fan_out.winner = index
+                for other_index, other in enumerate(fan_out.calls):
+                    if other["status"] == "pending":
+                        other["status"] = "skipped"
+                    elif other["status"] == "in-progress":
+                        to_stop.append(other_index)
+        for other_index in to_stop:
+            self._stop(fan_out, other_index)
+        self._advance(fan_out)
+
+    def _fetch_analysis(self, call_id):
+        """
+        Poll Bland for the analysis of an ended call, None if it never comes
+        """
+        deadline = time.monotonic() + self.analysis_timeout
+        while time.monotonic() < deadline:
+            try:
+                analysis = self.client.get_call(call_id).json().get("analysis")
+            except (requests.exceptions.RequestException, ValueError):
+                analysis = None
+            if analysis:
+                return analysis
+            time.sleep(min(2, max(0, deadline - time.monotonic())))
+        return None
+
+    def _stop(self, fan_out, index):
+        call = fan_out.calls[index]
+        try:
+            self.client.stop_call(call["call_id"])
+            status, error = "stopped", None
+        except requests.exceptions.RequestException as e:
+            status, error = "in-progress", f"Could not stop the call: {e}"
+        with self._lock:
+            call.update(status=status, error=error)
+            if status == "stopped":
+                self._forget(call["call_id"])
@@ -0,0 +1,252 @@
+import time
+import httpx
+import requests
+import metrics
+from store import WebhookStore
+from waiters import CallWaiters
+from campaigns import CampaignScheduler, campaign_error
+from fanout import FanOutScheduler, fan_out_error
+from idempotency import IdempotencyCache, IdempotencyKeyReused
+from availability import InvalidTimeRange, NoOverlap
+from upstream import UpstreamUnavailable
+from prompt_registry import PROMPTS, UnknownPrompt
+from calls import entry_call_data, entry_error
+
+
+def upstream_unavailable(e):
+    # the call was not sent because Bland is failing or too busy, the client can retry later
+    return (
+        {"status": "error", "message": str(e)},
+        503,
+        {"Retry-After": str(e.retry_after or 1)},
+    )
+
+
+def upstream_error(e, status_code):
+    # Bland did not answer: 504 when it timed out, 502 when it could not be reached
+    return (
+        {"status": "error", "message": f"Could not reach Bland: {str(e) or type(e).__name__}"},
+        status_code,
+        {"Retry-After": "1"},
+    )
+
+
+def sent(result):
+    # only calls Bland accepted are remembered, failed ones can be retried
+    return result[0] == 200
+
+
+def call_response(result, replayed):
+    # Bland's answer with its status, telling the client when to retry 429s and 5xx
+    status_code, text, retry_after = result
+    headers = {"Idempotent-Replayed": str(replayed).lower()}
+    if status_code == 429 or status_code >= 500:
+        headers["Retry-After"] = str(retry_after or 1)
+    return text, status_code, headers
+
+
+def key_reused(e):
+    # the client sent the Idempotency-Key of an earlier request with another body
+    return {"status": "error", "message": str(e)}, 422
+
+
+class CallService:
+    """
+    Request handling shared by app.py and asgi.py, so both serving modes answer
+    the same way. Routes read the request, place calls to Bland with their own
+    client and turn the result into a response here. Campaigns and fan-outs
+    dispatch from background threads with the blocking client given.
+    """
+
+    def __init__(self, background_bland):
+        self.webhook_store = WebhookStore()
+        self.webhook_store.start()
+        self.call_waiters = CallWaiters()
+        self.idempotency = IdempotencyCache()
+        self.campaigns = CampaignScheduler(background_bland, entry_call_data)
+        self.fan_outs = FanOutScheduler(
+            background_bland, entry_call_data, lookup_webhook=self.latest_webhook
+        )
+
+    def record_request_latency(self, started_at, request, response):
+        metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - started_at,
+            method=request.method,
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            status=response.status_code,
+        )
+        return response
+
+    def receive_webhook(self, webhook_data, timeout=0.1):
+        if not isinstance(webhook_data, dict) or not webhook_data.get("call_id"):
+            return "Webhook body must be a JSON object with a call_id", 400
+        if not self.webhook_store.put(webhook_data, timeout=timeout):
+            return "Webhook queue is full", 503
+        self.call_waiters.notify(webhook_data["call_id"], webhook_data)
+        self.fan_outs.webhook_received(webhook_data)
+        metrics.CALLS.webhook_received(webhook_data["call_id"])
+        return "Webhook data received"
+
+    def latest_webhook(self, call_id):
+        """
+        The webhook of a call if it was received, whether or not it is written yet
+        """
+        return self.call_waiters.wait(call_id, 0) or self.webhook_store.latest(call_id)
+
+    def completion_timeout(self, args):
+        return min(args.get("timeout", default=25, type=float), 60)
+
+    def completion(self, webhook_data):
+        if not webhook_data:
+            return "", 204
+        return webhook_data
+
+    def call_request(self, headers, route, build_call, *args):
+        """
+        Return ((idempotency key, request hash), Bland call payload, None), or
+        (None, None, response) when the call is not placed. The key is the
+        client's Idempotency-Key when given, otherwise the request hash, so a
+        client placing the same call twice on purpose has to send new keys.
+        """
+        # hashed before build_call, which pops the prompt fields from the body
+        fingerprint = self.idempotency.key(route, *args)
+        if "Idempotency-Key" in headers:
+            key = self.idempotency.key(route, headers["Idempotency-Key"])
+        else:
+            key = fingerprint
+        try:
+            return (key, fingerprint), build_call(*args), None
+        except NoOverlap as e:
+            return None, None, {"status": "skipped", "message": str(e)}
+        except (InvalidTimeRange, UnknownPrompt) as e:
+            return None, None, ({"status": "error", "message": str(e)}, 400)
+
+    def send(self, key, send_call):
+        key, fingerprint = key
+        try:
+            result, replayed = self.idempotency.run(
+                key, send_call, cacheable=sent, fingerprint=fingerprint
+            )
+        except IdempotencyKeyReused as e:
+            return key_reused(e)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable(e)
+        except requests.exceptions.Timeout as e:
+            return upstream_error(e, 504)
+        except requests.exceptions.RequestException as e:
+            return upstream_error(e, 502)
+        return call_response(result, replayed)
+
+    async def send_async(self, key, send_call):
+        key, fingerprint = key
+        try:
+            result, replayed = await self.idempotency.run_async(
+                key, send_call, cacheable=sent, fingerprint=fingerprint
+            )
+        except IdempotencyKeyReused as e:
+            return key_reused(e)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable(e)
+        except httpx.TimeoutException as e:
+            return upstream_error(e, 504)
+        except httpx.HTTPError as e:
+            return upstream_error(e, 502)
+        return call_response(result, replayed)
+
+    def batch_error(self, input_data):
+        """
+        The 400 response for a batch body without a list of calls, None otherwise
+        """
+        if not isinstance(input_data, dict) or not isinstance(input_data.get("calls"), list):
+            return {"error": "The body must be a JSON object with a list of calls"}, 400
+        return None
+
+    def batch_calls(self, entries):
+        """
+        Return the payloads to send and one result per entry, None for the
+        entries whose call is in the payloads
+        """
+        calls, results = [], []
+        for entry in entries:
+            error = entry_error(entry)
+            if error:
+                results.append({"error": error})
+                continue
+            try:
+                calls.append(entry_call_data(entry))
+                results.append(None)
+            except NoOverlap as e:
+                results.append({"skipped": str(e)})
+            except (InvalidTimeRange, UnknownPrompt) as e:
+                results.append({"error": str(e)})
+        return calls, results
+
+    def batch_response(self, entries, results, sent_results):
+        sent_results = iter(sent_results)
+        results = [result or next(sent_results) for result in results]
+        for entry, result in zip(entries, results):
+            result["phoneNumber"] = entry.get("phoneNumber") if isinstance(entry, dict) else None
+        return {"results": results}
+
+    def create_campaign(self, input_data):
+        error = campaign_error(input_data)
+        if error:
+            return {"error": error}, 400
+        campaign_id = self.campaigns.submit(
+            input_data["calls"],
+            priority=input_data.get("priority", 0),
+            max_concurrency=input_data.get("maxConcurrency"),
+            calling_hours=input_data.get("callingHours"),
+            max_attempts=input_data.get("maxAttempts", 3),
+        )
+        return {"campaign_id": campaign_id, "status_url": "/campaigns/" + campaign_id}, 202
+
+    def campaign(self, campaign_id):
+        progress = self.campaigns.progress(campaign_id)
+        if not progress:
+            return {"error": "Campaign not found"}, 404
+        return progress
+
+    def create_fan_out(self, input_data):
+        error = fan_out_error(input_data)
+        if error:
+            return {"error": error}, 400
+        fan_out_id = self.fan_outs.submit(
+            input_data["shops"],
+            input_data.get("data", {}),
+            pathway_id=input_data.get("pathwayId"),
+            max_concurrency=input_data.get("maxConcurrency", 3),
+        )
+        return {"fan_out_id": fan_out_id, "status_url": "/fan-outs/" + fan_out_id}, 202
+
+    def fan_out(self, fan_out_id):
+        progress = self.fan_outs.progress(fan_out_id)
+        if not progress:
+            return {"error": "Fan-out not found"}, 404
+        return progress
+
+    # the queries below block on SQLite, asgi.py runs them in a thread
+
+    def call_outcome(self, call_id):
+        outcome = self.webhook_store.outcome(call_id)
+        if not outcome:
+            return {"error": "Call not found"}, 404
+        return outcome
+
+    def bookings(self, args):
+        date = args.get("date", type=str)
+        limit = args.get("limit", default=1000, type=int)
+        try:
+            bookings = self.webhook_store.bookings_on(date, limit)
+        except (TypeError, ValueError):
+            return {"error": "date must be YYYY-MM-DD"}, 400
+        return {"date": date, "bookings": bookings}
+
+    def latest_shop_outcome(self, phone_number):
+        outcome = self.webhook_store.latest_outcome(phone_number)
+        if not outcome:
+            return {"error": "No calls to this shop"}, 404
+        return outcome
+
+    def prompts(self):
+        return PROMPTS.describe()
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyKeyReused(ValueError):
+    """
+    Raised when an idempotency key is sent again with a different request
+    """
+
+
+class IdempotencyCache:
+    """
+    Remembers the result of a request for ttl seconds by idempotency key, so a
+    retried request gets the original result back instead of being repeated.
+    Identical requests arriving while the first one is still running wait for
+    it and share its result. At most max_entries keys are kept (least recently
+    used first out). Each key remembers the fingerprint of its request, and
+    the key cannot be reused for a request with another fingerprint.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl or float(os.environ.get("IDEMPOTENCY_TTL", "600"))
+        self.max_entries = max_entries or int(
+            os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000")
+        )
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def key(self, *parts):
+        """
+        Hash of the given JSON-serializable request parts
+        """
+        canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def run(self, key, fn, cacheable=lambda result: True, fingerprint=None):
+        """
+        Return (result, replayed): the cached or in-flight result for key if
+        there is one, otherwise the result of fn(), which is kept for ttl
+        seconds when cacheable(result) is true
+        """
+        entry, leader = self._claim(key, fingerprint, threading.Event)
+        if not leader:
+            entry["done"].wait()
+            return self._shared_result(entry)
+
+        try:
+            entry["result"] = fn()
+        except Exception as e:
+            entry["error"] = e
+            raise
+        finally:
+            self._finish(key, entry, cacheable)
+        return entry["result"], False
+
+    async def run_async(
+        self, key, fn, cacheable=lambda result: True, fingerprint=None
+    ):
+        """
+        Same as run for a coroutine function fn, without blocking the event loop
+        """
+        entry, leader = self._claim(key, fingerprint, asyncio.Event)
+        if not leader:
+            await entry["done"].wait()
+            return self._shared_result(entry)
+
+        try:
+            entry["result"] = await fn()
+        except Exception as e:
+            entry["error"] = e
+            raise
+        finally:
+            self._finish(key, entry, cacheable)
+        return entry["result"], False
+
+    def _claim(self, key, fingerprint, event_type):
+        """
+        Return the entry for key and whether the caller has to run the request
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["done"].is_set() and entry["expires_at"] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry:
+                if entry["fingerprint"] != fingerprint:
+                    raise IdempotencyKeyReused(
+                        "The Idempotency-Key was already used for a different request"
+                    )
+                self._entries.move_to_end(key)
+                return entry, False
+            entry = {
+                "done": event_type(),
+                "result": None,
+                "error": None,
+                "expires_at": float("inf"),
+                "fingerprint": fingerprint,
+            }
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry, True
+
+    def _shared_result(self, entry):
+        if entry["error"]:
+            raise entry["error"]
+        return entry["result"], True
+
+    def _finish(self, key, entry, cacheable):
+        with self._lock:
+            if entry["error"] or not cacheable(entry["result"]):
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            else:
+                entry["expires_at"] = time.monotonic() + self.ttl
+        entry["done"].set()
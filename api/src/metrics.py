@@ -0,0 +1,203 @@
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs)
+        + "}"
+    )
+
+
+class Metric:
+    """
+    Base class for metrics rendered in the Prometheus text format
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def label_values(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self.lock:
+            for values, value in sorted(self.values.items()):
+                lines.append(
+                    f"{self.name}{format_labels(self.labelnames, values)} {value}"
+                )
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.label_values(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0,
+                    "count": 0,
+                }
+            series = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    labels = format_labels(self.labelnames, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(self.labelnames, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling requests to this service",
+    ["method", "route", "status"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "bland_request_duration_seconds",
+    "Time spent waiting on the Bland API",
+    ["endpoint"],
+)
+UPSTREAM_RESPONSES = Counter(
+    "bland_responses_total",
+    "Responses received from the Bland API",
+    ["endpoint", "status"],
+)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    "bland_concurrency_limit",
+    "Requests allowed in flight to the Bland API at once",
+    ["client"],
+)
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "bland_circuit_state",
+    "State of the circuit breaker in front of the Bland API (0 closed, 1 half-open, 2 open)",
+    ["client"],
+)
+UPSTREAM_REJECTED = Counter(
+    "bland_rejected_requests_total",
+    "Requests not sent to the Bland API because it was failing or too busy",
+    ["client", "reason"],
+)
+CALLS_IN_FLIGHT = Gauge(
+    "calls_in_flight",
+    "Calls dispatched whose webhook has not been received yet",
+)
+WEBHOOK_LAG = Histogram(
+    "call_webhook_lag_seconds",
+    "Time from dispatching a call to receiving its webhook",
+    buckets=(30, 60, 120, 300, 600, 900, 1200, 1800, 3600),
+)
+
+
+class CallTracker:
+    """
+    Tracks when each call was dispatched to measure how long until its webhook
+    arrives. Calls without a webhook after max_age seconds, or beyond the
+    max_calls most recent ones, are forgotten.
+    """
+
+    def __init__(self, max_age=2 * 60 * 60, max_calls=100000):
+        self.max_age = max_age
+        self.max_calls = max_calls
+        self.lock = threading.Lock()
+        self.dispatched_at = {}
+
+    def dispatched(self, call_id):
+        with self.lock:
+            self.dispatched_at[call_id] = time.monotonic()
+            if len(self.dispatched_at) > self.max_calls:
+                del self.dispatched_at[next(iter(self.dispatched_at))]
+
+    def webhook_received(self, call_id):
+        with self.lock:
+            dispatched_at = self.dispatched_at.pop(call_id, None)
+        if dispatched_at is not None:
+            WEBHOOK_LAG.observe(time.monotonic() - dispatched_at)
+
+    def update_in_flight(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [
+                call_id
+                for call_id, dispatched_at in self.dispatched_at.items()
+                if now - dispatched_at > self.max_age
+            ]
+            for call_id in expired:
+                del self.dispatched_at[call_id]
+            CALLS_IN_FLIGHT.set(len(self.dispatched_at))
+
+
+CALLS = CallTracker()
+
+
+def render():
+    """
+    Render every registered metric in the Prometheus text format
+    """
+    CALLS.update_in_flight()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,116 @@
+import os
+import re
+import threading
+import time
+
+PROMPTS_PATH = os.environ.get(
+    "PROMPTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+)
+DEFAULT_PROMPT_NAME = "book_appointment"
+
+# Bland fills in {{variable}} placeholders from the call's request_data
+VARIABLE_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+class UnknownPrompt(LookupError):
+    """
+    Raised when no prompt has the requested name and version
+    """
+
+
+class PromptTemplate:
+    """
+    A prompt loaded from disk along with the variables it expects
+    """
+
+    def __init__(self, name, version, text):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.variables = sorted(set(VARIABLE_PATTERN.findall(text)))
+
+    def describe(self):
+        return {"name": self.name, "version": self.version, "variables": self.variables}
+
+
+class PromptRegistry:
+    """
+    Versioned prompts stored as {path}/{name}/v{version}.txt, loaded once and
+    kept in memory. Files are checked for changes at most every
+    reload_interval seconds, so prompts can be edited without a restart.
+    """
+
+    def __init__(self, path=PROMPTS_PATH, reload_interval=None):
+        self.path = path
+        self.reload_interval = float(
+            reload_interval
+            if reload_interval is not None
+            else os.environ.get("PROMPTS_RELOAD_INTERVAL", "5")
+        )
+        self._lock = threading.Lock()
+        self._prompts = {}
+        self._mtimes = {}
+        self._checked_at = 0
+        self.reload()
+
+    def get(self, name=None, version=None):
+        """
+        The prompt with the given name and version, the latest version when none is given
+        """
+        name = name or DEFAULT_PROMPT_NAME
+        self._reload_if_due()
+        versions = self._prompts.get(name)
+        if not versions:
+            raise UnknownPrompt(f"Unknown prompt {name}")
+        if version is None:
+            return versions[max(versions)]
+        try:
+            return versions[int(str(version).lstrip("v"))]
+        except (KeyError, ValueError):
+            raise UnknownPrompt(f"Unknown version {version} of prompt {name}")
+
+    def describe(self):
+        self._reload_if_due()
+        return {
+            name: [versions[version].describe() for version in sorted(versions)]
+            for name, versions in sorted(self._prompts.items())
+        }
+
+    def reload(self):
+        """
+        Load the prompt files that were added or changed since the last reload
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            mtimes = {}
+            for name in os.listdir(self.path) if os.path.isdir(self.path) else []:
+                prompt_dir = os.path.join(self.path, name)
+                if not os.path.isdir(prompt_dir):
+                    continue
+                for entry in os.scandir(prompt_dir):
+                    match = re.fullmatch(r"v(\d+)\.txt", entry.name)
+                    if match:
+                        mtimes[(name, int(match.group(1)))] = (
+                            entry.path,
+                            entry.stat().st_mtime_ns,
+                        )
+            if mtimes == self._mtimes:
+                return
+
+            prompts = {}
+            for (name, version), (file_path, mtime) in mtimes.items():
+                if self._mtimes.get((name, version)) == (file_path, mtime):
+                    template = self._prompts[name][version]
+                else:
+                    with open(file_path, "r", encoding="UTF-8") as f:
+                        template = PromptTemplate(name, version, f.read())
+                prompts.setdefault(name, {})[version] = template
+            self._prompts = prompts
+            self._mtimes = mtimes
+
+    def _reload_if_due(self):
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload()
+
+
+PROMPTS = PromptRegistry()
@@ -0,0 +1,284 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+CALL_OUTCOME_COLUMNS = (
+    "call_id",
+    "phone_number",
+    "shop_name",
+    "status",
+    "is_appointment_booked",
+    "appointment_time",
+    "received_at",
+)
+
+
+def call_outcome(webhook_data, received_at):
+    """
+    Extract the indexed outcome fields from a webhook body
+    """
+    analysis = webhook_data.get("analysis")
+    analysis = analysis if isinstance(analysis, dict) else {}
+    variables = webhook_data.get("variables")
+    variables = variables if isinstance(variables, dict) else {}
+    booked = analysis.get("is_appointment_booked")
+    return (
+        webhook_data.get("call_id"),
+        webhook_data.get("to"),
+        variables.get("supplierShopName"),
+        webhook_data.get("status"),
+        None if booked is None else int(bool(booked)),
+        analysis.get("appointment_time") or None,
+        received_at,
+    )
+
+
+class WebhookStore:
+    """
+    Append-only SQLite store for webhook bodies. Bodies are queued in memory and
+    written in batches by a background thread so the webhook can be acknowledged
+    immediately. The outcome of each call is also kept in an indexed calls table.
+    """
+
+    def __init__(self, path=None, flush_interval=None, max_queue_size=None):
+        self.path = path or os.environ.get("WEBHOOK_DB_PATH", "calls.db")
+        self.flush_interval = flush_interval or float(
+            os.environ.get("WEBHOOK_FLUSH_INTERVAL", "1")
+        )
+        self.queue = queue.Queue(
+            maxsize=max_queue_size
+            or int(os.environ.get("WEBHOOK_QUEUE_SIZE", "10000"))
+        )
+        self.batch_size = 500
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+        connection = self.connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhooks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                call_id TEXT,
+                received_at REAL NOT NULL,
+                body TEXT NOT NULL
+            )
+            """
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS webhooks_call_id ON webhooks (call_id)"
+        )
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS calls (
+                call_id TEXT PRIMARY KEY,
+                phone_number TEXT,
+                shop_name TEXT,
+                status TEXT,
+                is_appointment_booked INTEGER,
+                appointment_time TEXT,
+                received_at REAL NOT NULL
+            )
+            """
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS calls_phone_number "
+            "ON calls (phone_number, received_at)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS calls_booked_appointment_time "
+            "ON calls (is_appointment_booked, appointment_time)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS calls_appointment_time ON calls (appointment_time)"
+        )
+        if not connection.execute("SELECT 1 FROM calls LIMIT 1").fetchone():
+            self._backfill_calls(connection)
+        connection.commit()
+        connection.close()
+        self._readers = threading.local()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def put(self, webhook_data, timeout=0.1):
+        """
+        Queue a webhook body for writing, returning False if the queue stays full
+        """
+        try:
+            self.queue.put((time.time(), webhook_data), timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def reader(self):
+        """
+        Connection for queries, reused by each thread
+        """
+        if not hasattr(self._readers, "connection"):
+            self._readers.connection = self.connect()
+            self._readers.connection.row_factory = sqlite3.Row
+        return self._readers.connection
+
+    def latest(self, call_id):
+        """
+        Return the most recently written webhook body for call_id, if any
+        """
+        row = (
+            self.reader()
+            .execute(
+                "SELECT body FROM webhooks WHERE call_id = ? ORDER BY id DESC LIMIT 1",
+                (call_id,),
+            )
+            .fetchone()
+        )
+        return json.loads(row["body"]) if row else None
+
+    def outcome(self, call_id):
+        """
+        Return the outcome of a call, if its webhook was received
+        """
+        row = (
+            self.reader()
+            .execute("SELECT * FROM calls WHERE call_id = ?", (call_id,))
+            .fetchone()
+        )
+        return self._outcome(row) if row else None
+
+    def latest_outcome(self, phone_number):
+        """
+        Return the outcome of the most recent call to a shop's phone number
+        """
+        row = (
+            self.reader()
+            .execute(
+                "SELECT * FROM calls WHERE phone_number = ? "
+                "ORDER BY received_at DESC LIMIT 1",
+                (phone_number,),
+            )
+            .fetchone()
+        )
+        return self._outcome(row) if row else None
+
+    def bookings_on(self, date, limit=1000):
+        """
+        Return the booked calls whose appointment is on date (YYYY-MM-DD), by appointment time
+        """
+        next_day = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime(
+            "%Y-%m-%d"
+        )
+        rows = self.reader().execute(
+            "SELECT * FROM calls WHERE is_appointment_booked = 1 "
+            "AND appointment_time >= ? AND appointment_time < ? "
+            "ORDER BY appointment_time LIMIT ?",
+            (date, next_day, limit),
+        )
+        return [self._outcome(row) for row in rows]
+
+    def _outcome(self, row):
+        outcome = dict(row)
+        if outcome["is_appointment_booked"] is not None:
+            outcome["is_appointment_booked"] = bool(outcome["is_appointment_booked"])
+        return outcome
+
+    def _run(self):
+        connection = self.connect()
+        while not (self._stopped.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write_batch(connection, batch)
+        connection.close()
+
+    def _write_batch(self, connection, batch):
+        # a body that cannot be written must not stop the writer, or every
+        # later webhook would be lost: write the batch one body at a time
+        # and drop only the ones that fail
+        try:
+            self._write(connection, batch)
+            return
+        except Exception:
+            connection.rollback()
+            logger.exception("Could not write a batch of %d webhooks", len(batch))
+        for received_at, webhook_data in batch:
+            try:
+                self._write(connection, [(received_at, webhook_data)])
+            except Exception:
+                connection.rollback()
+                logger.exception(
+                    "Dropped the webhook of call %s", webhook_data.get("call_id")
+                )
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stopped.is_set():
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, connection, batch):
+        connection.executemany(
+            "INSERT INTO webhooks (call_id, received_at, body) VALUES (?, ?, ?)",
+            [
+                (webhook_data.get("call_id"), received_at, json.dumps(webhook_data))
+                for received_at, webhook_data in batch
+            ],
+        )
+        self._write_outcomes(
+            connection,
+            [call_outcome(webhook_data, received_at) for received_at, webhook_data in batch],
+        )
+        connection.commit()
+
+    def _write_outcomes(self, connection, outcomes):
+        # a later webhook without analysis keeps the analysis of an earlier one
+        connection.executemany(
+            f"""
+            INSERT INTO calls ({", ".join(CALL_OUTCOME_COLUMNS)})
+            VALUES ({", ".join("?" * len(CALL_OUTCOME_COLUMNS))})
+            ON CONFLICT (call_id) DO UPDATE SET
+                phone_number = COALESCE(excluded.phone_number, phone_number),
+                shop_name = COALESCE(excluded.shop_name, shop_name),
+                status = COALESCE(excluded.status, status),
+                is_appointment_booked = COALESCE(
+                    excluded.is_appointment_booked, is_appointment_booked
+                ),
+                appointment_time = COALESCE(excluded.appointment_time, appointment_time),
+                received_at = excluded.received_at
+            """,
+            (outcome for outcome in outcomes if outcome[0]),
+        )
+
+    def _backfill_calls(self, connection):
+        rows = connection.execute("SELECT received_at, body FROM webhooks ORDER BY id")
+        self._write_outcomes(
+            connection,
+            (call_outcome(json.loads(body), received_at) for received_at, body in rows),
+        )
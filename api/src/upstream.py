@@ -0,0 +1,234 @@
+import asyncio
+import os
+import threading
+import time
+import metrics
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of sending a request when Bland is failing or too many
+    requests are already waiting for it
+    """
+
+    def __init__(self, message, retry_after=None):
+        super(UpstreamUnavailable, self).__init__(message)
+        self.retry_after = retry_after
+
+
+def outcome_of(status_code):
+    """
+    How a Bland response counts for the gate: 429 means overloaded, 5xx failed
+    """
+    if status_code == 429:
+        return "overloaded"
+    if status_code >= 500:
+        return "failed"
+    return "succeeded"
+
+
+def retry_after_of(headers):
+    retry_after = headers.get("Retry-After", "")
+    return int(retry_after) if retry_after.isdigit() else None
+
+
+class UpstreamGate:
+    """
+    Admission control in front of Bland. At most `limit` requests are in flight:
+    the limit grows by one per round of fast successful responses and is halved
+    on 429s, 5xx, errors and slow responses (additive increase, multiplicative
+    decrease). A 429's Retry-After holds back new requests until it passes.
+    After failure_threshold failures in a row the circuit opens and requests
+    fail right away for open_timeout seconds, then a single probe decides
+    whether it closes again. At most max_queue requests wait for a slot, each
+    for up to queue_timeout seconds.
+    """
+
+    def __init__(
+        self,
+        name,
+        max_limit,
+        min_limit=1,
+        latency_target=None,
+        failure_threshold=None,
+        open_timeout=None,
+        max_queue=None,
+        queue_timeout=None,
+    ):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_target = latency_target or float(
+            os.environ.get("BLAND_LATENCY_TARGET", "5")
+        )
+        self.failure_threshold = failure_threshold or int(
+            os.environ.get("BLAND_FAILURE_THRESHOLD", "5")
+        )
+        self.open_timeout = open_timeout or float(
+            os.environ.get("BLAND_CIRCUIT_OPEN_TIMEOUT", "30")
+        )
+        self.max_queue = max_queue or int(os.environ.get("BLAND_MAX_QUEUE", "1000"))
+        self.queue_timeout = queue_timeout or float(
+            os.environ.get("BLAND_QUEUE_TIMEOUT", "10")
+        )
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_until = 0
+        self.paused_until = 0
+        self.decreased_at = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._callbacks = []
+        self._update_metrics()
+
+    def acquire(self):
+        """
+        Wait for a slot to send a request, raising UpstreamUnavailable if the
+        circuit is open, the queue is full or no slot frees up in time
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        with self._condition:
+            wait = self._try_acquire()
+            if wait is None:
+                return
+            self._enqueue()
+            try:
+                while wait is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject("timeout")
+                        raise UpstreamUnavailable(
+                            "Timed out waiting to send the request to Bland",
+                            retry_after=1,
+                        )
+                    self._condition.wait(min(wait, remaining))
+                    wait = self._try_acquire()
+            finally:
+                self._waiting -= 1
+
+    async def acquire_async(self):
+        """
+        Same as acquire, without blocking the event loop
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.queue_timeout
+        with self._lock:
+            wait = self._try_acquire()
+            if wait is None:
+                return
+            self._enqueue()
+        try:
+            while wait is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self._reject("timeout")
+                    raise UpstreamUnavailable(
+                        "Timed out waiting to send the request to Bland", retry_after=1
+                    )
+                woken = loop.create_future()
+
+                def wake():
+                    loop.call_soon_threadsafe(
+                        lambda: woken.done() or woken.set_result(None)
+                    )
+
+                with self._lock:
+                    self._callbacks.append(wake)
+                try:
+                    await asyncio.wait_for(woken, min(wait, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    if wake in self._callbacks:
+                        self._callbacks.remove(wake)
+                    wait = self._try_acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self, outcome, latency=0, retry_after=None):
+        """
+        Free the slot of a finished request. outcome is "succeeded", "overloaded"
+        (429), "failed" (5xx, timeout or network error) or "interrupted" (no
+        answer to judge Bland by).
+        """
+        now = time.monotonic()
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == "interrupted":
+                pass
+            elif outcome == "failed":
+                self.failures += 1
+                self._decrease(now)
+                if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                    self.state = OPEN
+                    self.opened_until = now + self.open_timeout
+            else:
+                self.failures = 0
+                self.state = CLOSED
+                if outcome == "overloaded":
+                    self._decrease(now)
+                    if retry_after:
+                        self.paused_until = max(self.paused_until, now + retry_after)
+                elif latency > self.latency_target:
+                    self._decrease(now)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._update_metrics()
+            self._condition.notify_all()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _try_acquire(self):
+        """
+        Take a slot and return None, or return how long to wait before trying
+        again. Raises UpstreamUnavailable while the circuit is open.
+        """
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now < self.opened_until:
+                self._reject("circuit_open")
+                raise UpstreamUnavailable(
+                    "Bland is failing, not sending requests for now",
+                    retry_after=int(self.opened_until - now) + 1,
+                )
+            self.state = HALF_OPEN
+            self._update_metrics()
+        if self.state == HALF_OPEN and self.in_flight:
+            # only the probe request goes through until the circuit closes
+            return self.queue_timeout
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return self.queue_timeout
+        self.in_flight += 1
+        return None
+
+    def _enqueue(self):
+        if self._waiting >= self.max_queue:
+            self._reject("queue_full")
+            raise UpstreamUnavailable(
+                "Too many requests waiting for Bland", retry_after=1
+            )
+        self._waiting += 1
+
+    def _decrease(self, now):
+        # halve at most once per latency target, so one burst of errors from
+        # requests sent at the same time does not collapse the limit
+        if now - self.decreased_at >= self.latency_target:
+            self.limit = max(self.min_limit, self.limit / 2)
+            self.decreased_at = now
+
+    def _reject(self, reason):
+        metrics.UPSTREAM_REJECTED.inc(client=self.name, reason=reason)
+
+    def _update_metrics(self):
+        metrics.UPSTREAM_CONCURRENCY_LIMIT.set(int(self.limit), client=self.name)
+        metrics.UPSTREAM_CIRCUIT_STATE.set(self.state, client=self.name)
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+
+class CallWaiters:
+    """
+    Lets requests block until the webhook for a given call_id has been received
+    """
+
+    def __init__(self, max_completed=10000):
+        self.max_completed = max_completed
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._callbacks = {}
+        self._completed = OrderedDict()
+
+    def notify(self, call_id, webhook_data):
+        """
+        Record the webhook body for call_id and wake up everyone waiting on it
+        """
+        with self._lock:
+            self._completed[call_id] = webhook_data
+            self._completed.move_to_end(call_id)
+            while len(self._completed) > self.max_completed:
+                self._completed.popitem(last=False)
+            waiting = self._waiting.pop(call_id, None)
+            callbacks = self._callbacks.pop(call_id, [])
+        if waiting:
+            waiting[0].set()
+        for callback in callbacks:
+            callback()
+
+    def wait(self, call_id, timeout):
+        """
+        Return the webhook body for call_id, or None if it is not received within timeout seconds
+        """
+        with self._lock:
+            if call_id in self._completed:
+                return self._completed[call_id]
+            waiting = self._waiting.setdefault(call_id, [threading.Event(), 0])
+            waiting[1] += 1
+        waiting[0].wait(timeout)
+        with self._lock:
+            waiting[1] -= 1
+            if not waiting[1] and self._waiting.get(call_id) is waiting:
+                del self._waiting[call_id]
+            return self._completed.get(call_id)
+
+    async def wait_async(self, call_id, timeout):
+        """
+        Same as wait, without blocking the event loop
+        """
+        loop = asyncio.get_running_loop()
+        received = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(
+                lambda: received.done() or received.set_result(None)
+            )
+
+        with self._lock:
+            if call_id in self._completed:
+                return self._completed[call_id]
+            self._callbacks.setdefault(call_id, []).append(wake)
+        try:
+            await asyncio.wait_for(received, timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._lock:
+            callbacks = self._callbacks.get(call_id)
+            if callbacks and wake in callbacks:
+                callbacks.remove(wake)
+                if not callbacks:
+                    del self._callbacks[call_id]
+            return self._completed.get(call_id)
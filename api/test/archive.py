@@ -0,0 +1,35 @@
+import json
+import os
+import sqlite3
+
+
+def read_calls(paths):
+    """
+    Stream call records from .json files, .jsonl files, directories of .json files
+    and the webhook database (.db) without loading them all at once
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for file_name in sorted(os.listdir(path)):
+                if file_name.endswith(".json") and file_name != "results.json":
+                    yield from read_calls([os.path.join(path, file_name)])
+        elif path.endswith(".jsonl"):
+            with open(path, "r", encoding="UTF-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        elif path.endswith(".db"):
+            connection = sqlite3.connect(path)
+            try:
+                # only the latest webhook of each call
+                rows = connection.execute(
+                    "SELECT body FROM webhooks WHERE id IN "
+                    "(SELECT MAX(id) FROM webhooks GROUP BY call_id) ORDER BY id"
+                )
+                for (body,) in rows:
+                    yield json.loads(body)
+            finally:
+                connection.close()
+        else:
+            with open(path, "r", encoding="UTF-8") as f:
+                yield json.load(f)
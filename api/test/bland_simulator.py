@@ -0,0 +1,304 @@
+import argparse
+import heapq
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import requests
+from flask import Flask, request
+
+
+class BlandSimulator:
+    """
+    In-memory stand-in for the Bland API. Calls go through queued, in-progress
+    and completed with configurable durations, then fire their webhook. Bland's
+    analysis becomes available analysis_delay seconds after the call completes.
+    """
+
+    def __init__(
+        self,
+        min_duration=2,
+        max_duration=10,
+        analysis_delay=1,
+        failure_rate=0,
+        booking_rate=0.5,
+        rate_limit=0,
+        latency=0,
+    ):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.analysis_delay = analysis_delay
+        self.failure_rate = failure_rate
+        self.booking_rate = booking_rate
+        self.rate_limit = rate_limit
+        self.latency = latency
+        self.calls = {}
+        self.inbound = {}
+        self._lock = threading.Lock()
+        self._events = []
+        self._condition = threading.Condition(self._lock)
+        self._tokens = rate_limit
+        self._tokens_updated_at = time.monotonic()
+        self._webhooks = requests.Session()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def allow_request(self):
+        """
+        Apply the rate limit of rate_limit calls per second, if any
+        """
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate_limit,
+                self._tokens + (now - self._tokens_updated_at) * self.rate_limit,
+            )
+            self._tokens_updated_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def create_call(self, data):
+        """
+        Start simulating a call for the given Bland call payload
+        """
+        call_id = str(uuid.uuid4())
+        duration = random.uniform(self.min_duration, self.max_duration)
+        call = {
+            "call_id": call_id,
+            "status": "queued",
+            "completed": False,
+            "to": data.get("phone_number"),
+            "from": data.get("from"),
+            "variables": dict(data.get("request_data") or {}),
+            "metadata": data.get("metadata") or {},
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "end_at": None,
+            "call_length": None,
+            "concatenated_transcript": "",
+            "transcripts": [],
+            "analysis": None,
+            "error_message": None,
+        }
+        with self._condition:
+            self.calls[call_id] = {"details": call, "data": data}
+            self._schedule(0.5, call_id, self._start)
+            self._schedule(0.5 + duration, call_id, self._complete)
+        return call_id
+
+    def get_call(self, call_id):
+        """
+        Return a snapshot of the call details, or None for an unknown call
+        """
+        with self._lock:
+            call = self.calls.get(call_id)
+            return dict(call["details"]) if call else None
+
+    def stop_call(self, call_id):
+        """
+        End an ongoing call right away
+        """
+        with self._condition:
+            if call_id not in self.calls:
+                return False
+            if not self.calls[call_id]["details"]["completed"]:
+                self._schedule(0, call_id, self._complete)
+            return True
+
+    def _schedule(self, delay, call_id, action):
+        heapq.heappush(
+            self._events, (time.monotonic() + delay, uuid.uuid4().hex, call_id, action)
+        )
+        self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._events or self._events[0][0] > time.monotonic():
+                    timeout = (
+                        self._events[0][0] - time.monotonic() if self._events else None
+                    )
+                    self._condition.wait(timeout)
+                _, _, call_id, action = heapq.heappop(self._events)
+            action(call_id)
+
+    def _start(self, call_id):
+        with self._lock:
+            details = self.calls[call_id]["details"]
+            if details["status"] == "queued":
+                details["status"] = "in-progress"
+                details["started_at"] = datetime.now().isoformat()
+
+    def _complete(self, call_id):
+        with self._lock:
+            call = self.calls[call_id]
+            details = call["details"]
+            if details["completed"]:
+                return
+            now = datetime.now()
+            started_at = datetime.fromisoformat(details["started_at"] or now.isoformat())
+            details["status"] = "completed"
+            details["completed"] = True
+            details["end_at"] = now.isoformat()
+            details["call_length"] = (now - started_at).total_seconds() / 60
+            details["concatenated_transcript"] = self._transcript(details["variables"])
+            self._schedule(self.analysis_delay, call_id, self._analyze)
+            webhook = call["data"].get("webhook")
+            body = dict(details)
+        if webhook:
+            threading.Thread(
+                target=self._send_webhook, args=(webhook, body), daemon=True
+            ).start()
+
+    def _analyze(self, call_id):
+        with self._lock:
+            details = self.calls[call_id]["details"]
+            booked = random.random() < self.booking_rate
+            details["analysis"] = {
+                "is_appointment_booked": booked,
+                "appointment_time": self._appointment_time(details["variables"])
+                if booked
+                else None,
+            }
+
+    def _send_webhook(self, webhook, body):
+        try:
+            self._webhooks.post(webhook, json=body, timeout=10)
+        except requests.exceptions.RequestException:
+            pass
+
+    def _transcript(self, variables):
+        shop_name = variables.get("supplierShopName", "the shop")
+        service_name = variables.get("serviceName", "a service")
+        return (
+            f"assistant: Hi, is this {shop_name}? \n"
+            f"user: Yes, how can I help you? \n"
+            f"assistant: I'd like to book an appointment for {service_name}. \n"
+            f"user: Sure, let me check our availability. "
+        )
+
+    def _appointment_time(self, variables):
+        time_range = variables.get("firstTimeRange", "")
+        try:
+            date, time_window = time_range.split(" ", 1)
+            start_time = time_window.split(" - ")[0]
+            start = datetime.strptime(f"{date} {start_time}", "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            start = datetime.now().replace(minute=0, second=0, microsecond=0)
+        return (start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def create_app(simulator):
+    app = Flask(__name__)
+
+    @app.before_request
+    def simulate_latency():
+        if simulator.latency:
+            time.sleep(simulator.latency)
+
+    @app.route("/v1/calls", methods=["POST"])
+    def send_call():
+        if not request.headers.get("Authorization"):
+            return {"status": "error", "message": "Missing authorization"}, 401
+        if not simulator.allow_request():
+            return (
+                {"status": "error", "message": "Rate limit exceeded"},
+                429,
+                {"Retry-After": "1"},
+            )
+        if random.random() < simulator.failure_rate:
+            return {"status": "error", "message": "Simulated failure"}, 500
+        data = request.get_json()
+        if not data.get("phone_number"):
+            return {"status": "error", "message": "Missing phone_number"}, 400
+        call_id = simulator.create_call(data)
+        return {
+            "status": "success",
+            "message": "Call successfully queued.",
+            "call_id": call_id,
+        }
+
+    @app.route("/v1/calls/<call_id>", methods=["GET"])
+    def call_details(call_id):
+        details = simulator.get_call(call_id)
+        if not details:
+            return {"status": "error", "message": "Call not found"}, 404
+        return details
+
+    @app.route("/v1/calls/<call_id>/stop", methods=["POST"])
+    def stop_call(call_id):
+        if not simulator.stop_call(call_id):
+            return {"status": "error", "message": "Call not found"}, 404
+        return {"status": "success", "message": "Call ended successfully."}
+
+    @app.route("/v1/inbound/<phone_number>", methods=["GET", "POST"])
+    def inbound(phone_number):
+        if request.method == "POST":
+            simulator.inbound[phone_number] = request.get_json()
+            return {"status": "success", "message": "Inbound number updated"}
+        if phone_number not in simulator.inbound:
+            return {"status": "error", "message": "Inbound number not found"}, 404
+        return {"phone_number": phone_number, **simulator.inbound[phone_number]}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Bland API")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument(
+        "--min-duration", type=float, default=2, help="Shortest call, in seconds"
+    )
+    parser.add_argument(
+        "--max-duration", type=float, default=10, help="Longest call, in seconds"
+    )
+    parser.add_argument(
+        "--analysis-delay",
+        type=float,
+        default=1,
+        help="Seconds between the end of a call and its analysis being available",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0,
+        help="Fraction of calls rejected with a 500",
+    )
+    parser.add_argument(
+        "--booking-rate",
+        type=float,
+        default=0.5,
+        help="Fraction of calls that end with a booked appointment",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=0,
+        help="Calls accepted per second before answering 429 (default: unlimited)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="Seconds added before answering every request",
+    )
+    args = parser.parse_args()
+
+    simulator = BlandSimulator(
+        min_duration=args.min_duration,
+        max_duration=args.max_duration,
+        analysis_delay=args.analysis_delay,
+        failure_rate=args.failure_rate,
+        booking_rate=args.booking_rate,
+        rate_limit=args.rate_limit,
+        latency=args.latency,
+    )
+    create_app(simulator).run(port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
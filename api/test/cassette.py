@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+
+
+class CassetteStore:
+    """
+    Recorded call payloads keyed by scenario (test_id) and a hash of the call payload
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def payload_hash(self, payload):
+        """
+        Stable hash of the payload sent to trigger the call
+        """
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    def cassette_path(self, test_id, payload):
+        return os.path.join(self.path, f"{test_id}-{self.payload_hash(payload)}.json")
+
+    def load(self, test_id, payload):
+        """
+        Load the recorded call for test_id and payload
+        """
+        cassette_path = self.cassette_path(test_id, payload)
+        if not os.path.exists(cassette_path):
+            raise FileNotFoundError(
+                f"No recorded call for {test_id} with this payload at {cassette_path}, "
+                "run it once with AI_AGENT_MODE=record"
+            )
+        with open(cassette_path, "r", encoding="UTF-8") as f:
+            return json.load(f)
+
+    def save(self, test_id, payload, call_id, call):
+        """
+        Record the completed call for test_id and payload, replacing any older recording
+        """
+        os.makedirs(self.path, exist_ok=True)
+        cassette = {
+            "test_id": test_id,
+            "payload_hash": self.payload_hash(payload),
+            "payload": payload,
+            "call_id": call_id,
+            "call": call,
+        }
+        with open(self.cassette_path(test_id, payload), "w", encoding="UTF-8") as f:
+            f.write(json.dumps(cassette, indent=2))
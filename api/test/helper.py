@@ -1,38 +1,111 @@
 import requests
+import functools
 import json
 import os
-import time
-from openai import AzureOpenAI
+import threading
+import uuid
 from datetime import datetime
+from poller import CallPoller
+from cassette import CassetteStore
+from verdict_cache import VerdictCache
+from results import ResultsStore
+from inbound_sync import InboundConfigSync
+from transcript import TranscriptCompactor
+
+
+@functools.lru_cache(maxsize=None)
+def load_prompts(prompt_path):
+    """
+    Read the prompt templates once per process, by agent name
+    """
+    prompts = {}
+    for prompt_file in os.listdir(prompt_path):
+        with open(os.path.join(prompt_path, prompt_file), "r") as f:
+            prompts[prompt_file.split(".")[0]] = f.read()
+    return prompts
+
+
+@functools.lru_cache(maxsize=None)
+def inbound_config_sync(inbound_url):
+    """
+    One config sync per Bland API for the whole run, so numbers configured by
+    earlier scenarios are not pushed again
+    """
+    return InboundConfigSync(inbound_url)
+
+
+@functools.lru_cache(maxsize=256)
+def render_prompt(template, **variables):
+    """
+    Fill in a prompt template, reusing the result for the same variables
+    """
+    return template.format(**variables)
 
 
 class AIAgentHelper:
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, inbound_phone_number=None, **kwargs):
         super(AIAgentHelper, self).__init__(*args, **kwargs)
-        self.INBOUND_PHONE_NUMBER = os.environ["INBOUND_PHONE_NUMBER"]
-        self.CALL_DETAILS_URL = "https://api.bland.ai/v1/calls/"
-        self.INBOUND_CALL_URL = (
-            "https://api.bland.ai/v1/inbound/" + self.INBOUND_PHONE_NUMBER
+        self.INBOUND_PHONE_NUMBER = (
+            inbound_phone_number or os.environ["INBOUND_PHONE_NUMBER"]
         )
+        self.BLAND_API_URL = os.environ.get("BLAND_API_URL", "https://api.bland.ai")
+        self.CALL_DETAILS_URL = self.BLAND_API_URL + "/v1/calls/"
+        self.INBOUND_SYNC = inbound_config_sync(self.BLAND_API_URL + "/v1/inbound/")
         self.CALL_URL = (
             os.environ["LOCAL_URL"]
             + "/calls/call-send?phoneNumber="
             + self.INBOUND_PHONE_NUMBER
         )
-        self.AZURE_OPENAI_CLIENT = AzureOpenAI(
+        # live: place real calls, record: place real calls and save them as cassettes,
+        # replay: serve calls from saved cassettes without dialing
+        self.MODE = os.environ.get("AI_AGENT_MODE", "live")
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.CASSETTES = CassetteStore(os.path.join(script_dir, "cassettes"))
+        self.CASSETTE_CALLS = {}
+        self.RESULTS = ResultsStore(os.path.join(script_dir, "logs", "results.jsonl"))
+        # set LLM_VERDICT_CACHE=off to always ask the LLM again (and refresh the cache)
+        self.USE_VERDICT_CACHE = os.environ.get("LLM_VERDICT_CACHE", "on") != "off"
+        self.PROMPTS = load_prompts(os.path.join(script_dir, "prompts"))
+        # transcripts are judged without hesitations and repeats, and trimmed to
+        # this many tokens (0 to never trim)
+        self.TRANSCRIPTS = TranscriptCompactor(
+            budget=int(os.environ.get("LLM_TRANSCRIPT_TOKEN_BUDGET", "3000"))
+        )
+        self.COMPLETION_URL = os.environ["LOCAL_URL"] + "/calls/{call_id}/completion"
+        self.LONG_POLLING_TIMEOUT = 25
+        self.CALL_POLLER = CallPoller(
+            fetch=self.fetch_call_details,
+            is_complete=self.is_call_completed,
+            min_interval=1,
+            max_interval=30,
+        )
+
+    @functools.cached_property
+    def AZURE_OPENAI_CLIENT(self):
+        """
+        Created on first use, so runs that never ask the LLM do not import openai
+        """
+        from openai import AzureOpenAI
+
+        return AzureOpenAI(
             api_key=os.environ["AZURE_OPENAI_API_KEY"],
             api_version="2024-02-01",
             azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
         )
+
+    @functools.cached_property
+    def VERDICT_CACHE(self):
+        """
+        Opened on first use, since opening it scans every cached verdict
+        """
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        prompt_path = os.path.join(script_dir, "prompts")
-        self.PROMPTS = {}
-        for prompt_file in os.listdir(prompt_path):
-            with open(os.path.join(prompt_path, prompt_file), "r") as f:
-                agent_name = prompt_file.split(".")[0]
-                self.PROMPTS[agent_name] = f.read()
-        self.SHORT_POLLING_INTERVAL = 10
+        max_age_days = float(os.environ.get("LLM_VERDICT_CACHE_MAX_AGE_DAYS", "30"))
+        return VerdictCache(
+            os.path.join(script_dir, "logs", "verdicts"),
+            max_entries=int(os.environ.get("LLM_VERDICT_CACHE_MAX_ENTRIES", "10000")),
+            max_age=max_age_days * 24 * 60 * 60,
+        )
 
     def is_time_in_range(self, range_str, booked_time_str):
         """
@@ -59,18 +132,16 @@ class AIAgentHelper:
         """
         Setup the inbound agent acting as the repair shop using Bland API
         """
-        endpoint = self.INBOUND_CALL_URL
-        headers = {
-            "Content-Type": "application/json",
-            "authorization": os.environ["BLAND_API_KEY"],
-        }
+        if self.MODE == "replay":
+            return
         services = "\n".join([f"- {service}" for service in services])
         vehicles_requirements = "\n".join(
             [f"- {vehicle}" for vehicle in vehicles_requirements]
         )
         time_ranges = "\n".join([f"- {time_range}" for time_range in time_ranges])
 
-        prompt_template = self.PROMPTS["INBOUND_AGENT"].format(
+        prompt_template = render_prompt(
+            self.PROMPTS["INBOUND_AGENT"],
             shop_name=shop_name,
             services=services,
             vehicles_requirements=vehicles_requirements,
@@ -78,20 +149,27 @@ class AIAgentHelper:
             additional_instructions=additional_instructions,
         )
 
-        payload = json.dumps(
+        # only pushed when it differs from the config already live on the number
+        self.INBOUND_SYNC.sync(
+            self.INBOUND_PHONE_NUMBER,
             {
                 "prompt": prompt_template,
                 "analysis_schema": {},
-            }
+            },
         )
-        requests.request("POST", endpoint, headers=headers, data=payload)
 
-    def trigger_call(self, payload):
+    def trigger_call(self, payload, test_id=None):
         """
         Trigger a call using Bland API to from the AI Agent to the repair shop inbound agent
         """
+        if self.MODE == "replay":
+            cassette = self.CASSETTES.load(test_id, payload)
+            self.CASSETTE_CALLS[cassette["call_id"]] = cassette
+            return cassette["call_id"]
         endpoint = self.CALL_URL
-        headers = {"Content-Type": "application/json"}
+        # most tests send the same data.json to the same number, a new key per
+        # call keeps the server from replaying an earlier test's call
+        headers = {"Content-Type": "application/json", "Idempotency-Key": str(uuid.uuid4())}
         response = requests.request(
             "POST", endpoint, headers=headers, data=json.dumps(payload)
         )
@@ -100,6 +178,8 @@ class AIAgentHelper:
                 f"Failed to trigger call: {response.text}"
             )
         call_id = response.json()["call_id"]
+        if self.MODE == "record":
+            self.CASSETTE_CALLS[call_id] = {"test_id": test_id, "payload": payload}
         return call_id
 
     def write_logs(self, test_id, logs):
@@ -111,22 +191,62 @@ class AIAgentHelper:
         with open(logs_path, "w") as f:
             f.write(json.dumps(logs))
 
-    def get_call_details(self, call_id, test_id):
+    def fetch_call_details(self, call_id):
         """
-        Get the call details from Bland API given the call_id
+        Get the current call details from Bland API given the call_id
         """
-        time.sleep(self.SHORT_POLLING_INTERVAL)
         endpoint = self.CALL_DETAILS_URL + call_id
-        payload = {}
         headers = {"authorization": os.environ["BLAND_API_KEY"]}
-        response = requests.request("GET", endpoint, headers=headers, data=payload)
-        data = response.json()
+        response = requests.request("GET", endpoint, headers=headers)
+        return response.json()
+
+    def is_call_completed(self, data):
+        """
+        Check if the call has ended and Bland's analysis is available
+        """
+        return data.get("status") == "completed" and bool(data.get("analysis"))
+
+    def wait_for_webhook(self, call_id, future):
+        """
+        Long-poll the local server until the webhook for call_id is received,
+        then have the poller fetch the call details right away
+        """
+        endpoint = self.COMPLETION_URL.format(call_id=call_id)
+        while not future.done():
+            try:
+                response = requests.request(
+                    "GET",
+                    endpoint,
+                    params={"timeout": self.LONG_POLLING_TIMEOUT},
+                    timeout=self.LONG_POLLING_TIMEOUT + 10,
+                )
+            except requests.exceptions.RequestException:
+                return
+            if response.status_code == 200:
+                self.CALL_POLLER.poke(call_id)
+                return
+            if response.status_code != 204:
+                return
+
+    def get_call_details(self, call_id, test_id):
+        """
+        Get the call details from Bland API given the call_id once the call is completed.
+        Completion is signalled by the webhook, with backoff polling as a fallback.
+        """
+        if self.MODE == "replay":
+            return self.CASSETTE_CALLS.pop(call_id)["call"]
+        future = self.CALL_POLLER.watch(call_id, initial_delay=5)
         print("Call in progress...")
-        while data["status"] != "completed" or not data["analysis"]:
-            time.sleep(self.SHORT_POLLING_INTERVAL)
-            response = requests.request("GET", endpoint, headers=headers, data=payload)
-            data = response.json()
+        threading.Thread(
+            target=self.wait_for_webhook, args=(call_id, future), daemon=True
+        ).start()
+        data = future.result()
         self.write_logs(test_id, data)
+        if self.MODE == "record":
+            cassette = self.CASSETTE_CALLS.pop(call_id)
+            self.CASSETTES.save(
+                cassette["test_id"] or test_id, cassette["payload"], call_id, data
+            )
         print("Call completed\n")
         return data
 
@@ -148,9 +268,9 @@ class AIAgentHelper:
             return False, fail_msg
         return True, ""
 
-    def assert_llm(self, data, expected_behavior):
+    def llm_content(self, data, expected_behavior):
         """
-        Analyze the call details using OpenAI and determine if the test should pass
+        Render the call details and expected behavior into the content judged by the LLM
         """
         # Extract the necessary information from the call details
         driver_full_name = data["variables"]["driverFullName"]
@@ -168,10 +288,12 @@ class AIAgentHelper:
         service_type = data["variables"]["serviceName"]
         driver_first_time_window = data["variables"]["firstTimeRange"]
         driver_second_time_window = data["variables"]["secondTimeRange"]
-        transcript = data["concatenated_transcript"]
+        transcript = self.TRANSCRIPTS.compact(
+            data.get("call_id"), data["concatenated_transcript"]
+        )
 
         # Fill in the template with the extracted information
-        data = f"""
+        return f"""
         - Driver's full name: {driver_full_name}
         - Driver's phone number:{driver_phone_number}
         - Driver's vehicle information: {driver_vehicle_info}
@@ -182,41 +304,85 @@ class AIAgentHelper:
         - Expected behavior: {expected_behavior}
         """
 
+    def verdict_cache_key(self, content):
+        return self.VERDICT_CACHE.key(
+            self.PROMPTS["TESTING_AGENT"], content, os.environ["AZURE_DEPLOYMENT_NAME"]
+        )
+
+    def cached_verdict(self, content):
+        """
+        Get the verdict of an identical previous request, None if there is none
+        """
+        if not self.USE_VERDICT_CACHE:
+            return None
+        return self.VERDICT_CACHE.get(self.verdict_cache_key(content))
+
+    def llm_verdict(self, content):
+        """
+        Get the raw verdict of the LLM for the rendered content, raising on API errors
+        """
         prompt_template = self.PROMPTS["TESTING_AGENT"]
+        deployment_name = os.environ["AZURE_DEPLOYMENT_NAME"]
+
+        # Reuse the verdict of an identical previous request if there is one
+        result = self.cached_verdict(content)
+        if result is not None:
+            return result
+
+        cache_key = self.verdict_cache_key(content)
+        response = self.AZURE_OPENAI_CLIENT.chat.completions.create(
+            model=deployment_name,
+            messages=[
+                {
+                    "role": "system",
+                    "content": prompt_template,
+                },
+                {"role": "user", "content": content},
+            ],
+        )
+        result = response.choices[0].message.content.strip()
+        self.VERDICT_CACHE.put(cache_key, result)
+        return result
+
+    def parse_verdict(self, result):
+        """
+        Turn the raw verdict of the LLM into a (passed, explanation) pair
+        """
+        result = (result or "").strip()
+        if result != "True":
+            lines = result.split("\n", 1)
+            # the explanation is expected on the second line, but not always given
+            explanation = lines[1].strip() if len(lines) > 1 else ""
+            return False, explanation or f"The LLM gave no explanation: {result!r}"
+        return True, ""
+
+    def assert_llm(self, data, expected_behavior):
+        """
+        Analyze the call details using OpenAI and determine if the test should pass
+        """
+        content = self.llm_content(data, expected_behavior)
 
         # Use OpenAI to analyze the call details and determine if the test should pass
         try:
-            response = self.AZURE_OPENAI_CLIENT.chat.completions.create(
-                model=os.environ["AZURE_DEPLOYMENT_NAME"],
-                messages=[
-                    {
-                        "role": "system",
-                        "content": prompt_template,
-                    },
-                    {"role": "user", "content": data},
-                ],
-            )
+            result = self.llm_verdict(content)
         except Exception as e:
             return False, str(e)
 
-        # Extract the response from OpenAI and check if the test passed
-        result = response.choices[0].message.content.strip()
-        if result != "True":
-            explanation = result.split("\n")[1]
-            return False, explanation
-        return True, ""
+        return self.parse_verdict(result)
 
     def log_results(self, test_id, call_id, result, msg):
         """
-        Log the results of test_id to results.json
+        Append the results of test_id to results.jsonl
         """
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        results_path = os.path.join(script_dir, "logs", "results.json")
-        if not os.path.exists(results_path):
-            with open(results_path, "w") as f:
-                f.write(json.dumps({}))
-        with open(results_path, "r") as f:
-            results = json.load(f)
-        results[test_id] = {"call_id": call_id, "passed": result, "explanation": msg}
-        with open(results_path, "w") as f:
-            f.write(json.dumps(results))
+        self.RESULTS.append(
+            test_id=test_id, call_id=call_id, passed=result, explanation=msg
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def shared_helper(inbound_phone_number=None):
+    """
+    One helper per inbound number for the whole run, built the first time a
+    test asks for it
+    """
+    return AIAgentHelper(inbound_phone_number=inbound_phone_number)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+import requests
+
+
+class InboundConfigSync:
+    """
+    Keeps the inbound agent of each number configured, only pushing a config
+    to Bland when it differs from the one already live. The hash of the last
+    config seen on each number is remembered for the whole run, and the live
+    config is read back the first time a number is used.
+    """
+
+    def __init__(self, inbound_url):
+        self.inbound_url = inbound_url
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._hashes = {}
+
+    def config_hash(self, config):
+        """
+        Stable hash of the prompt and analysis schema of an inbound config
+        """
+        canonical = json.dumps(
+            {
+                "prompt": config.get("prompt"),
+                "analysis_schema": config.get("analysis_schema") or {},
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def live_config(self, phone_number):
+        """
+        The config currently set on the number, or None if it cannot be read
+        """
+        try:
+            response = self.session.get(
+                self.inbound_url + phone_number, headers=self.headers(), timeout=30
+            )
+            if response.status_code == 200:
+                return response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        return None
+
+    def sync(self, phone_number, config):
+        """
+        Push config to the number unless it is already live, returning whether
+        it was pushed. Raises if Bland does not accept the config.
+        """
+        config_hash = self.config_hash(config)
+        with self._lock:
+            known_hash = self._hashes.get(phone_number)
+        if known_hash is None:
+            live_config = self.live_config(phone_number)
+            known_hash = self.config_hash(live_config) if live_config else None
+        if known_hash == config_hash:
+            with self._lock:
+                self._hashes[phone_number] = config_hash
+            return False
+
+        # forget the number until the push succeeds, so a failure is retried
+        with self._lock:
+            self._hashes.pop(phone_number, None)
+        response = self.session.post(
+            self.inbound_url + phone_number,
+            headers=self.headers(),
+            data=json.dumps(config),
+            timeout=30,
+        )
+        try:
+            failed = response.json().get("status") == "error"
+        except ValueError:
+            failed = False
+        if response.status_code != 200 or failed:
+            raise requests.exceptions.RequestException(
+                f"Failed to set up inbound agent on {phone_number}: {response.text}"
+            )
+        with self._lock:
+            self._hashes[phone_number] = config_hash
+        return True
+
+    def headers(self):
+        return {
+            "Content-Type": "application/json",
+            "authorization": os.environ["BLAND_API_KEY"],
+        }
@@ -0,0 +1,189 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from openai import RateLimitError
+from helper import AIAgentHelper
+from archive import read_calls
+from transcript import count_tokens
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most one minute of tokens
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        Block until amount tokens are available and take them
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after_seconds(retry_after, default):
+    """
+    Seconds to wait from a Retry-After header, which is either a number of
+    seconds or an HTTP date, or default when it is missing or cannot be parsed
+    """
+    if not retry_after:
+        return default
+    try:
+        return max(0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class JudgingPipeline:
+    """
+    Judges many calls with assert_llm's prompt on a worker pool, within Azure
+    OpenAI's requests-per-minute and tokens-per-minute quotas
+    """
+
+    def __init__(self, helper, workers=8, rpm=60, tpm=60000, max_retries=5):
+        self.helper = helper
+        # Rate limits are retried here, with backoff, instead of inside the client
+        self.helper.AZURE_OPENAI_CLIENT = helper.AZURE_OPENAI_CLIENT.with_options(
+            max_retries=0
+        )
+        self.workers = workers
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+
+    def estimate_tokens(self, content):
+        """
+        Approximate token count of a judging request
+        """
+        return count_tokens(self.helper.PROMPTS["TESTING_AGENT"]) + count_tokens(content)
+
+    def judge(self, record, expected_behavior=None):
+        """
+        Judge a single call record, which is either a call payload or a recorded
+        cassette holding one under "call"
+        """
+        call = record.get("call", record)
+        result = {"call_id": call.get("call_id")}
+        expected_behavior = record.get("expected_behavior", expected_behavior)
+        if not expected_behavior:
+            result.update(passed=False, explanation="No expected behavior")
+            return result
+        try:
+            content = self.helper.llm_content(call, expected_behavior)
+        except (KeyError, TypeError) as e:
+            result.update(passed=False, explanation=f"Missing call detail: {e}")
+            return result
+
+        # cached verdicts do not reach Azure, so they do not count against the quotas
+        verdict = self.helper.cached_verdict(content)
+        for attempt in range(self.max_retries + 1):
+            if verdict is not None:
+                break
+            self.requests.acquire()
+            self.tokens.acquire(self.estimate_tokens(content))
+            try:
+                verdict = self.helper.llm_verdict(content)
+                break
+            except RateLimitError as e:
+                if attempt == self.max_retries:
+                    result.update(passed=False, explanation=str(e))
+                    return result
+                retry_after = e.response.headers.get("retry-after")
+                time.sleep(retry_after_seconds(retry_after, 2**attempt))
+            except Exception as e:
+                result.update(passed=False, explanation=str(e))
+                return result
+
+        passed, explanation = self.helper.parse_verdict(verdict)
+        result.update(passed=passed, explanation=explanation)
+        return result
+
+    def run(self, records, output, expected_behavior=None):
+        """
+        Judge every record, writing each verdict to output as a JSON line as soon
+        as it is ready. At most twice as many records as workers are held at once.
+        """
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+        output_lock = threading.Lock()
+
+        def judge_and_write(record):
+            try:
+                try:
+                    result = self.judge(record, expected_behavior)
+                except Exception as e:
+                    # every record gets a line, even one that could not be judged
+                    call = record.get("call", record) if isinstance(record, dict) else {}
+                    result = {
+                        "call_id": call.get("call_id") if isinstance(call, dict) else None,
+                        "passed": False,
+                        "explanation": f"Could not judge the call: {e!r}",
+                    }
+                with output_lock:
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for record in records:
+                in_flight.acquire()
+                executor.submit(judge_and_write, record)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Judge recorded calls with the TESTING_AGENT prompt"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Call records: .json files, .jsonl files, directories or the webhook .db",
+    )
+    parser.add_argument(
+        "--expected-behavior",
+        help="Expected behavior for records that do not have their own",
+    )
+    parser.add_argument("--output", help="File to write verdicts to (default: stdout)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=60, help="Requests per minute")
+    parser.add_argument("--tpm", type=int, default=60000, help="Tokens per minute")
+    args = parser.parse_args()
+
+    pipeline = JudgingPipeline(
+        AIAgentHelper(), workers=args.workers, rpm=args.rpm, tpm=args.tpm
+    )
+    output = open(args.output, "a", encoding="UTF-8") if args.output else sys.stdout
+    try:
+        pipeline.run(read_calls(args.paths), output, args.expected_behavior)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
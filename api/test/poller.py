@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class CallPoller:
+    """
+    Polls many calls from a single background thread with adaptive backoff.
+    Each watched call resolves a Future with its details once complete.
+    """
+
+    def __init__(self, fetch, is_complete, min_interval=1, max_interval=30):
+        self.fetch = fetch
+        self.is_complete = is_complete
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._calls = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, call_id, initial_delay=None):
+        """
+        Start polling call_id and return a Future resolving to its completed details
+        """
+        interval = initial_delay or self.min_interval
+        with self._condition:
+            if call_id not in self._calls:
+                self._calls[call_id] = [Future(), time.monotonic() + interval, interval]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return self._calls[call_id][0]
+
+    def poke(self, call_id):
+        """
+        Poll call_id right away and reset its backoff, e.g. once its webhook arrives
+        """
+        with self._condition:
+            if call_id in self._calls:
+                self._calls[call_id][1] = time.monotonic()
+                self._calls[call_id][2] = self.min_interval
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    due = [
+                        call_id
+                        for call_id, (_, next_poll, _) in self._calls.items()
+                        if next_poll <= now
+                    ]
+                    if due:
+                        break
+                    if self._calls:
+                        timeout = min(entry[1] for entry in self._calls.values()) - now
+                    else:
+                        timeout = None
+                    self._condition.wait(timeout)
+            for call_id in due:
+                self._poll(call_id)
+
+    def _poll(self, call_id):
+        try:
+            data = self.fetch(call_id)
+        except Exception:
+            data = None
+        with self._condition:
+            entry = self._calls[call_id]
+            if data is not None and self.is_complete(data):
+                del self._calls[call_id]
+            else:
+                entry[1] = time.monotonic() + entry[2]
+                entry[2] = min(entry[2] * 2, self.max_interval)
+                return
+        entry[0].set_result(data)
@@ -0,0 +1,42 @@
+import os
+import queue
+
+
+class InboundNumberPool:
+    """
+    Pool of inbound phone numbers, each leased by at most one scenario at a time
+    since setting up the inbound agent reconfigures the whole number
+    """
+
+    def __init__(self, numbers):
+        self.numbers = list(numbers)
+        self._available = queue.Queue()
+        for number in self.numbers:
+            self._available.put(number)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build the pool from INBOUND_PHONE_NUMBERS (comma separated), falling back
+        to INBOUND_PHONE_NUMBER
+        """
+        numbers = os.environ.get("INBOUND_PHONE_NUMBERS") or os.environ.get(
+            "INBOUND_PHONE_NUMBER", ""
+        )
+        return cls(number.strip() for number in numbers.split(",") if number.strip())
+
+    def acquire(self):
+        """
+        Lease a number, blocking until one is available
+        """
+        if not self.numbers:
+            raise ValueError(
+                "No inbound phone numbers, set INBOUND_PHONE_NUMBERS or INBOUND_PHONE_NUMBER"
+            )
+        return self._available.get()
+
+    def release(self, number):
+        """
+        Return a leased number to the pool
+        """
+        self._available.put(number)
@@ -0,0 +1,284 @@
+import argparse
+import json
+import sys
+import numpy as np
+from archive import read_calls
+
+# Calls are read into columns this many at a time, so memory stays flat however
+# large the archive is
+CHUNK_SIZE = 10000
+# Call lengths are counted in one-second bins up to an hour, so percentiles are
+# exact to the second without keeping every duration
+DURATION_BINS = 3600
+
+# Where the booked appointment falls relative to the driver's time ranges
+PLACEMENTS = [
+    "first_range",
+    "second_range",
+    "before_ranges",
+    "between_ranges",
+    "after_ranges",
+    "unknown",
+]
+
+
+def iso_time(date, time_str):
+    hours, rest = time_str.strip().split(":", 1)
+    return f"{date}T{int(hours):02d}:{rest}"
+
+
+def parse_range(range_str):
+    """
+    ISO start and end of a range like "2024-08-19 9:00:00 - 12:00:00", or
+    (None, None) if it cannot be parsed or is not a real time
+    """
+    try:
+        date, time_range = range_str.strip().split(" ", 1)
+        start, end = time_range.split(" - ")
+        start, end = iso_time(date, start), iso_time(date, end)
+        # the same parsing the datetime64 columns do, e.g. rejects 25:00:00
+        np.datetime64(start)
+        np.datetime64(end)
+        return start, end
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def failure_reason(call, analysis):
+    """
+    Why a call did not end with a booking
+    """
+    if call.get("error_message"):
+        return str(call["error_message"])
+    if call.get("status") not in (None, "completed"):
+        return f"status: {call['status']}"
+    if not analysis:
+        return "no analysis"
+    return "not booked"
+
+
+class Encoder:
+    """
+    Maps labels (shops, services, reasons) to small integers for np.bincount
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def __call__(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+
+def grow(counts, size):
+    """
+    Pad an accumulated count array to size entries
+    """
+    return np.pad(counts, (0, max(0, size - len(counts))))
+
+
+class CallReport:
+    """
+    Aggregates call records chunk by chunk: each chunk is copied into NumPy
+    columns and folded into running totals with vectorized operations
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.shops = Encoder()
+        self.services = Encoder()
+        self.reasons = Encoder()
+        self.calls = 0
+        self.shop_calls = np.zeros(0, dtype=np.int64)
+        self.shop_bookings = np.zeros(0, dtype=np.int64)
+        self.service_calls = np.zeros(0, dtype=np.int64)
+        self.service_bookings = np.zeros(0, dtype=np.int64)
+        self.reason_counts = np.zeros(0, dtype=np.int64)
+        self.placement_counts = np.zeros(len(PLACEMENTS), dtype=np.int64)
+        self.duration_counts = np.zeros(DURATION_BINS + 1, dtype=np.int64)
+        self.duration_sum = 0.0
+        self._new_chunk()
+
+    def _new_chunk(self):
+        size = self.chunk_size
+        self._size = 0
+        self._shop = np.zeros(size, dtype=np.int32)
+        self._service = np.zeros(size, dtype=np.int32)
+        self._booked = np.zeros(size, dtype=bool)
+        self._reason = np.full(size, -1, dtype=np.int32)
+        self._duration = np.full(size, np.nan, dtype=np.float64)
+        self._appointment = np.full(size, np.datetime64("NaT"), dtype="datetime64[s]")
+        self._ranges = np.full((size, 4), np.datetime64("NaT"), dtype="datetime64[s]")
+
+    def add(self, record):
+        call = record.get("call", record)
+        variables = call.get("variables") or call.get("request_data") or {}
+        analysis = call.get("analysis") or {}
+        booked = bool(analysis.get("is_appointment_booked"))
+
+        i = self._size
+        self._shop[i] = self.shops(
+            variables.get("supplierShopName") or call.get("to") or "unknown"
+        )
+        self._service[i] = self.services(variables.get("serviceName") or "unknown")
+        self._booked[i] = booked
+        if not booked:
+            self._reason[i] = self.reasons(failure_reason(call, analysis))
+        if call.get("call_length") is not None:
+            self._duration[i] = float(call["call_length"])
+        if booked and analysis.get("appointment_time"):
+            try:
+                self._appointment[i] = analysis["appointment_time"]
+            except ValueError:
+                pass
+            self._ranges[i] = (
+                *parse_range(variables.get("firstTimeRange", "")),
+                *parse_range(variables.get("secondTimeRange", "")),
+            )
+
+        self._size += 1
+        if self._size == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Fold the current chunk into the totals
+        """
+        n = self._size
+        if not n:
+            return
+        shop, service, booked = self._shop[:n], self._service[:n], self._booked[:n]
+        self.calls += n
+
+        self.shop_calls = grow(self.shop_calls, len(self.shops.labels))
+        self.shop_calls += np.bincount(shop, minlength=len(self.shop_calls))
+        self.shop_bookings = grow(self.shop_bookings, len(self.shops.labels))
+        self.shop_bookings += np.bincount(
+            shop, weights=booked, minlength=len(self.shop_bookings)
+        ).astype(np.int64)
+        self.service_calls = grow(self.service_calls, len(self.services.labels))
+        self.service_calls += np.bincount(service, minlength=len(self.service_calls))
+        self.service_bookings = grow(self.service_bookings, len(self.services.labels))
+        self.service_bookings += np.bincount(
+            service, weights=booked, minlength=len(self.service_bookings)
+        ).astype(np.int64)
+
+        reason = self._reason[:n]
+        self.reason_counts = grow(self.reason_counts, len(self.reasons.labels))
+        self.reason_counts += np.bincount(
+            reason[reason >= 0], minlength=len(self.reason_counts)
+        )
+
+        # call_length is in minutes
+        duration = self._duration[:n]
+        duration = duration[~np.isnan(duration)] * 60
+        self.duration_sum += float(duration.sum())
+        self.duration_counts += np.bincount(
+            np.clip(duration, 0, DURATION_BINS).astype(np.int64),
+            minlength=DURATION_BINS + 1,
+        )
+
+        self.placement_counts += self._placements(
+            self._appointment[:n][booked], self._ranges[:n][booked]
+        )
+        self._new_chunk()
+
+    def _placements(self, appointment, ranges):
+        first_start, first_end, second_start, second_end = ranges.T
+        in_first = (appointment >= first_start) & (appointment <= first_end)
+        in_second = (appointment >= second_start) & (appointment <= second_end) & ~in_first
+        earliest = np.fmin(first_start, second_start)
+        latest = np.fmax(first_end, second_end)
+        known = ~np.isnat(appointment) & ~np.isnat(earliest)
+        outside = known & ~in_first & ~in_second
+        before = outside & (appointment < earliest)
+        after = outside & (appointment > latest)
+        between = outside & ~before & ~after
+        counts = [m.sum() for m in (in_first, in_second, before, between, after)]
+        return np.array(counts + [len(appointment) - sum(counts)], dtype=np.int64)
+
+    def duration_percentiles(self, fractions=(0.5, 0.9, 0.99)):
+        """
+        Call length percentiles in seconds, from the one-second histogram
+        """
+        total = self.duration_counts.sum()
+        if not total:
+            return {}
+        cumulative = np.cumsum(self.duration_counts)
+        ranks = np.ceil(np.array(fractions) * total)
+        seconds = np.searchsorted(cumulative, ranks)
+        return {f"p{round(f * 100)}": int(s) for f, s in zip(fractions, seconds)}
+
+    def result(self):
+        self.flush()
+
+        def rates(labels, calls, bookings):
+            return {
+                str(label): {
+                    "calls": int(calls[i]),
+                    "bookings": int(bookings[i]),
+                    "booking_rate": round(float(bookings[i] / calls[i]), 4),
+                }
+                for i, label in sorted(
+                    enumerate(labels), key=lambda item: -calls[item[0]]
+                )
+                if calls[i]
+            }
+
+        durations = int(self.duration_counts.sum())
+        return {
+            "calls": self.calls,
+            "bookings": int(self.shop_bookings.sum()),
+            "booking_rate_by_shop": rates(
+                self.shops.labels, self.shop_calls, self.shop_bookings
+            ),
+            "booking_rate_by_service": rates(
+                self.services.labels, self.service_calls, self.service_bookings
+            ),
+            "call_length_seconds": {
+                "calls": durations,
+                "mean": round(self.duration_sum / durations, 1) if durations else None,
+                **self.duration_percentiles(),
+            },
+            "appointment_time": dict(
+                zip(PLACEMENTS, (int(count) for count in self.placement_counts))
+            ),
+            "failure_reasons": {
+                label: int(count)
+                for label, count in sorted(
+                    zip(self.reasons.labels, self.reason_counts), key=lambda item: -item[1]
+                )
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Booking rates, call lengths, appointment times and failure reasons across recorded calls"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help=".json, .jsonl, directories of .json files or the webhook database (.db)",
+    )
+    parser.add_argument("--output", help="Write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = CallReport()
+    for record in read_calls(args.paths):
+        report.add(record)
+    result = json.dumps(report.result(), indent=2)
+
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as f:
+            f.write(result)
+    else:
+        sys.stdout.write(result + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import fcntl
+import json
+import os
+import time
+import uuid
+
+# Identifies the results of this process, so results from one run can be told apart
+RUN_ID = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+class ResultsStore:
+    """
+    Append-only store of test results, one JSON line per result. Appends are
+    locked so concurrent scenarios and processes never lose each other's results.
+    """
+
+    def __init__(self, path, run_id=RUN_ID):
+        self.path = path
+        self.run_id = run_id
+
+    def append(self, test_id, call_id, passed, explanation):
+        """
+        Append the result of test_id for the current run
+        """
+        record = {
+            "run_id": self.run_id,
+            "recorded_at": time.time(),
+            "test_id": test_id,
+            "call_id": call_id,
+            "passed": passed,
+            "explanation": explanation,
+        }
+        with open(self.path, "a", encoding="UTF-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def records(self):
+        """
+        Stream every recorded result, oldest first
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="UTF-8") as f:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+
+    def latest(self):
+        """
+        Latest result per test, in the same shape as results.json
+        """
+        results = {}
+        for record in self.records():
+            results[record["test_id"]] = {
+                "call_id": record["call_id"],
+                "passed": record["passed"],
+                "explanation": record["explanation"],
+            }
+        return results
+
+    def pass_rates(self):
+        """
+        Number of runs, passes and pass rate per test across all recorded runs
+        """
+        rates = {}
+        for record in self.records():
+            rate = rates.setdefault(record["test_id"], {"runs": 0, "passed": 0})
+            rate["runs"] += 1
+            rate["passed"] += bool(record["passed"])
+        for rate in rates.values():
+            rate["pass_rate"] = rate["passed"] / rate["runs"]
+        return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Update results.json with the latest result per test and print pass rates"
+    )
+    parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    logs_path = os.path.join(script_dir, "logs")
+    store = ResultsStore(os.path.join(logs_path, "results.jsonl"))
+
+    # results.json also holds results from before results.jsonl existed, which
+    # are kept for the tests that have no newer result
+    results_path = os.path.join(logs_path, "results.json")
+    results = {}
+    if os.path.exists(results_path):
+        with open(results_path, "r", encoding="UTF-8") as f:
+            results = json.load(f)
+    results.update(store.latest())
+    with open(results_path, "w") as f:
+        f.write(json.dumps(results, indent=2))
+    for test_id, rate in sorted(store.pass_rates().items()):
+        print(
+            f"{test_id}: {rate['passed']}/{rate['runs']} passed ({rate['pass_rate']:.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
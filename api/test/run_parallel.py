@@ -0,0 +1,73 @@
+import argparse
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from test_ai_agent import INBOUND_NUMBERS
+
+
+def flatten(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from flatten(test)
+        else:
+            yield test
+
+
+def run_tests(tests, workers):
+    """
+    Run the given tests concurrently, each on its own leased inbound number,
+    and merge their outcomes into a single result
+    """
+    merged = unittest.TestResult()
+    lock = threading.Lock()
+
+    def run_one(test):
+        result = unittest.TestResult()
+        test(result)
+        with lock:
+            merged.testsRun += result.testsRun
+            merged.failures.extend(result.failures)
+            merged.errors.extend(result.errors)
+            merged.skipped.extend(result.skipped)
+        status = "ok" if result.wasSuccessful() else "FAIL"
+        print(f"{test.id()} ... {status}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run_one, tests))
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the AI agent scenarios in parallel, one per inbound number"
+    )
+    parser.add_argument(
+        "tests",
+        nargs="*",
+        default=["test_ai_agent"],
+        help="Tests to run, e.g. test_ai_agent.TestAIAgent.test_tc001",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=len(INBOUND_NUMBERS.numbers),
+        help="Number of scenarios to run at the same time (default: one per inbound number)",
+    )
+    args = parser.parse_args()
+
+    tests = list(flatten(unittest.defaultTestLoader.loadTestsFromNames(args.tests)))
+    result = run_tests(tests, max(1, args.workers))
+
+    for test, traceback in result.failures + result.errors:
+        print("=" * 70)
+        print(f"FAIL: {test.id()}")
+        print(traceback)
+    print(
+        f"Ran {result.testsRun} tests: {len(result.failures)} failures, "
+        f"{len(result.errors)} errors"
+    )
+    raise SystemExit(0 if result.wasSuccessful() else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+import itertools
+import json
+import os
+
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios.json")
+
+# run_test arguments a factor level can set
+SCENARIO_FIELDS = (
+    "shop_name",
+    "services",
+    "vehicles_requirements",
+    "available_time_ranges",
+    "additional_instructions",
+)
+
+
+def load_factors(path=SCENARIOS_PATH):
+    """
+    Factors and their levels, in the order the agent runs into them during a
+    call: the first level that expects no booking decides the expected outcome
+    """
+    with open(path, "r", encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def pairwise(factors):
+    """
+    A small set of level combinations covering every pair of levels of any two
+    factors, picked greedily from the full combinations in a stable order
+    """
+    names = list(factors)
+    uncovered = {
+        ((a, level_a), (b, level_b))
+        for a, b in itertools.combinations(names, 2)
+        for level_a in factors[a]
+        for level_b in factors[b]
+    }
+    candidates = [
+        dict(zip(names, levels))
+        for levels in itertools.product(*(list(factors[name]) for name in names))
+    ]
+
+    def pairs(combination):
+        return {
+            ((a, combination[a]), (b, combination[b]))
+            for a, b in itertools.combinations(names, 2)
+        }
+
+    combinations = []
+    while uncovered:
+        best = max(candidates, key=lambda combination: len(pairs(combination) & uncovered))
+        uncovered -= pairs(best)
+        combinations.append(best)
+    return combinations
+
+
+def build_scenario(factors, combination, payload):
+    """
+    Turn a combination of levels into run_test arguments, with a test_id that
+    only changes when what the test does changes
+    """
+    scenario = {
+        "expected_booking_success": True,
+        "fail_msg": "Appointment was not booked at all",
+        "expected_behavior": "The appointment should be booked as normal.",
+        "valid_time_range": "",
+    }
+    payload = dict(payload)
+    outcome_decided = False
+    for name, level in combination.items():
+        spec = factors[name][level]
+        for field in SCENARIO_FIELDS:
+            if field in spec:
+                scenario[field] = spec[field]
+        for key in spec.get("remove_from_payload", []):
+            payload.pop(key, None)
+        if outcome_decided:
+            continue
+        if spec.get("expected_booking_success") is False:
+            outcome_decided = True
+            scenario.update(expected_booking_success=False, valid_time_range="")
+        if "valid_time_range" in spec:
+            scenario["valid_time_range"] = payload[spec["valid_time_range"]]
+        for field in ("fail_msg", "expected_behavior"):
+            if field in spec:
+                scenario[field] = spec[field]
+    scenario["payload"] = payload
+
+    canonical = json.dumps(scenario, sort_keys=True, separators=(",", ":"))
+    scenario["test_id"] = "SC-" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:8]
+    scenario["levels"] = combination
+    return scenario
+
+
+def generate(payload, factors=None):
+    """
+    Pairwise scenarios for the factor table, without duplicates
+    """
+    factors = factors or load_factors()
+    scenarios = {}
+    for combination in pairwise(factors):
+        scenario = build_scenario(factors, combination, payload)
+        scenarios.setdefault(scenario["test_id"], scenario)
+    return list(scenarios.values())
+
+
+def covered(scenarios, latest_results):
+    """
+    test_ids of the scenarios whose latest recorded result passed
+    """
+    return {
+        scenario["test_id"]
+        for scenario in scenarios
+        if latest_results.get(scenario["test_id"], {}).get("passed")
+    }
@@ -1,17 +1,34 @@
 import unittest
+import functools
 import os
 import json
-from helper import AIAgentHelper
+from helper import shared_helper
+from pool import InboundNumberPool
 
+INBOUND_NUMBERS = InboundNumberPool.from_env()
 
-class TestAIAgent(unittest.TestCase):
+
+@functools.lru_cache(maxsize=None)
+def load_payload():
+    """
+    Read data.json once for the whole run
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(script_dir, "data.json"), "r", encoding="UTF-8") as f:
+        return json.load(f)
+
+
+class AIAgentTestCase(unittest.TestCase):
+    """
+    Runs scenarios on an inbound number leased for the duration of each test
+    """
 
     def setUp(self):
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        data_path = os.path.join(script_dir, "data.json")
-        with open(data_path, "r", encoding="UTF-8") as f:
-            self.PAYLOAD = json.load(f)
-        self.helper = AIAgentHelper()
+        # a copy, so a test changing its payload does not affect the others
+        self.PAYLOAD = dict(load_payload())
+        inbound_phone_number = INBOUND_NUMBERS.acquire()
+        self.addCleanup(INBOUND_NUMBERS.release, inbound_phone_number)
+        self.helper = shared_helper(inbound_phone_number)
 
     def run_test(
         self,
@@ -38,7 +55,7 @@ class TestAIAgent(unittest.TestCase):
         )
         print("Inbound agent setup completed\n")
         print("Triggering call...")
-        call_id = self.helper.trigger_call(payload=payload)
+        call_id = self.helper.trigger_call(payload=payload, test_id=test_id)
         data = self.helper.get_call_details(call_id=call_id, test_id=test_id)
         print("Call details received\n")
 
@@ -68,6 +85,9 @@ class TestAIAgent(unittest.TestCase):
         )
         self.assertTrue(result, msg)
 
+
+class TestAIAgent(AIAgentTestCase):
+
     def test_tc001(self):
         """
         TC001: Agent cannot book appointment because the wrong shop is called
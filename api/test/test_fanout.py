@@ -0,0 +1,205 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from availability import NoOverlap  # noqa: E402
+from fanout import FanOutScheduler  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeBland:
+    """
+    Stands in for BlandClient: calls get ids call-0, call-1, ... in the order
+    they are placed, and analyses are served from self.analyses
+    """
+
+    max_workers = 4
+
+    def __init__(self, on_send=None):
+        self.on_send = on_send
+        self.placed = []
+        self.stopped = []
+        self.analyses = {}
+        self.lock = threading.Lock()
+
+    def send_call(self, data):
+        if data.get("noOverlap"):
+            raise NoOverlap("No overlap")
+        if data.get("fail"):
+            return FakeResponse({"message": "Invalid number"}, status_code=400)
+        with self.lock:
+            call_id = f"call-{len(self.placed)}"
+            self.placed.append(data["phone_number"])
+        if self.on_send:
+            self.on_send(call_id)
+        return FakeResponse({"call_id": call_id})
+
+    def stop_call(self, call_id):
+        self.stopped.append(call_id)
+        return FakeResponse({"status": "success"})
+
+    def get_call(self, call_id):
+        return FakeResponse({"analysis": self.analyses.get(call_id)})
+
+
+def build_call(entry):
+    return {"phone_number": entry["phoneNumber"], **entry["data"]}
+
+
+def shops(*phone_numbers, **data):
+    return [{"phoneNumber": phone_number, "data": data} for phone_number in phone_numbers]
+
+
+def booked(call_id):
+    return {
+        "call_id": call_id,
+        "analysis": {"is_appointment_booked": True, "appointment_time": "2024-08-19 10:00:00"},
+    }
+
+
+def not_booked(call_id):
+    return {"call_id": call_id, "analysis": {"is_appointment_booked": False}}
+
+
+class TestFanOut(unittest.TestCase):
+    """
+    Fan-outs against a fake Bland client, with webhooks delivered by hand
+    """
+
+    def wait_for(self, scheduler, fan_out_id, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            progress = scheduler.progress(fan_out_id)
+            if condition(progress):
+                return progress
+            time.sleep(0.01)
+        self.fail(f"Fan-out did not get there in time: {progress}")
+
+    def statuses(self, progress):
+        return [call["status"] for call in progress["calls"]]
+
+    def test_booking_stops_the_other_calls_and_skips_the_rest(self):
+        bland = FakeBland()
+        scheduler = FanOutScheduler(bland, build_call)
+        fan_out_id = scheduler.submit(shops("+1", "+2", "+3", "+4"), {}, max_concurrency=2)
+        self.wait_for(
+            scheduler, fan_out_id, lambda p: self.statuses(p)[:2] == ["in-progress"] * 2
+        )
+        call_id = scheduler.progress(fan_out_id)["calls"][1]["call_id"]
+        scheduler.webhook_received(booked(call_id))
+        progress = self.wait_for(scheduler, fan_out_id, lambda p: p["status"] == "booked")
+        self.assertEqual(
+            self.statuses(progress), ["stopped", "booked", "skipped", "skipped"]
+        )
+        self.assertEqual(progress["winner"]["phoneNumber"], "+2")
+        self.assertEqual(progress["winner"]["appointment_time"], "2024-08-19 10:00:00")
+        self.assertEqual(bland.placed, ["+1", "+2"])
+
+    def test_call_without_booking_dials_the_next_shop(self):
+        bland = FakeBland()
+        scheduler = FanOutScheduler(bland, build_call)
+        fan_out_id = scheduler.submit(shops("+1", "+2"), {}, max_concurrency=1)
+        self.wait_for(scheduler, fan_out_id, lambda p: self.statuses(p)[0] == "in-progress")
+        scheduler.webhook_received(not_booked("call-0"))
+        self.wait_for(scheduler, fan_out_id, lambda p: self.statuses(p)[1] == "in-progress")
+        scheduler.webhook_received(not_booked("call-1"))
+        progress = self.wait_for(scheduler, fan_out_id, lambda p: p["status"] == "not_booked")
+        self.assertEqual(self.statuses(progress), ["not_booked", "not_booked"])
+        self.assertIsNone(progress["winner"])
+
+    def test_skipped_and_failed_shops_do_not_hold_up_the_rest(self):
+        bland = FakeBland()
+        scheduler = FanOutScheduler(bland, build_call)
+        fan_out_id = scheduler.submit(
+            [
+                {"phoneNumber": "+1", "data": {"noOverlap": True}},
+                {"phoneNumber": "+2", "data": {"fail": True}},
+                {"phoneNumber": "+3", "data": {}},
+            ],
+            {},
+            max_concurrency=1,
+        )
+        progress = self.wait_for(
+            scheduler, fan_out_id, lambda p: self.statuses(p)[2] == "in-progress"
+        )
+        self.assertEqual(self.statuses(progress)[:2], ["skipped", "failed"])
+        self.assertEqual(progress["calls"][1]["error"], "Invalid number")
+
+    def test_webhook_arriving_before_the_call_is_registered(self):
+        webhooks = {}
+        scheduler = None
+
+        def deliver_webhook(call_id):
+            # the call ends before send_call has returned its call_id
+            webhooks[call_id] = not_booked(call_id)
+            scheduler.webhook_received(webhooks[call_id])
+
+        bland = FakeBland(on_send=deliver_webhook)
+        scheduler = FanOutScheduler(bland, build_call, lookup_webhook=webhooks.get)
+        fan_out_id = scheduler.submit(shops("+1", "+2"), {}, max_concurrency=1)
+        progress = self.wait_for(scheduler, fan_out_id, lambda p: p["status"] == "not_booked")
+        self.assertEqual(bland.placed, ["+1", "+2"])
+        self.assertEqual(self.statuses(progress), ["not_booked", "not_booked"])
+
+    def test_call_without_webhook_is_read_from_bland_after_call_timeout(self):
+        bland = FakeBland()
+        bland.analyses["call-0"] = booked("call-0")["analysis"]
+        scheduler = FanOutScheduler(
+            bland, build_call, call_timeout=0.1, analysis_timeout=0.1
+        )
+        fan_out_id = scheduler.submit(shops("+1", "+2"), {}, max_concurrency=1)
+        progress = self.wait_for(scheduler, fan_out_id, lambda p: p["status"] != "running")
+        self.assertEqual(self.statuses(progress), ["booked", "skipped"])
+
+    def test_call_without_webhook_or_analysis_ends_without_booking(self):
+        bland = FakeBland()
+        scheduler = FanOutScheduler(
+            bland, build_call, call_timeout=0.1, analysis_timeout=0.1
+        )
+        fan_out_id = scheduler.submit(shops("+1"), {}, max_concurrency=1)
+        progress = self.wait_for(scheduler, fan_out_id, lambda p: p["status"] != "running")
+        self.assertEqual(self.statuses(progress), ["not_booked"])
+
+    def test_late_webhook_after_booking_is_ignored(self):
+        bland = FakeBland()
+        scheduler = FanOutScheduler(bland, build_call)
+        fan_out_id = scheduler.submit(shops("+1", "+2"), {}, max_concurrency=2)
+        self.wait_for(
+            scheduler, fan_out_id, lambda p: self.statuses(p) == ["in-progress"] * 2
+        )
+        scheduler.webhook_received(booked("call-0"))
+        self.wait_for(scheduler, fan_out_id, lambda p: p["status"] == "booked")
+        self.assertFalse(scheduler.webhook_received(booked("call-1")))
+        progress = scheduler.progress(fan_out_id)
+        self.assertEqual(self.statuses(progress), ["booked", "stopped"])
+        self.assertEqual(progress["winner"]["phoneNumber"], "+1")
+
+    def test_ended_fan_out_is_forgotten_after_ttl(self):
+        bland = FakeBland()
+        scheduler = FanOutScheduler(bland, build_call, ttl=0.1)
+        fan_out_id = scheduler.submit(shops("+1"), {}, max_concurrency=1)
+        self.wait_for(scheduler, fan_out_id, lambda p: self.statuses(p) == ["in-progress"])
+        scheduler.webhook_received(not_booked("call-0"))
+        self.wait_for(scheduler, fan_out_id, lambda p: p["status"] == "not_booked")
+        time.sleep(0.2)
+        self.assertIsNone(scheduler.progress(fan_out_id))
+        self.assertEqual(scheduler.fan_outs, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
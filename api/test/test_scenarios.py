@@ -0,0 +1,56 @@
+import unittest
+import os
+from results import ResultsStore
+from scenarios import covered, generate
+from test_ai_agent import AIAgentTestCase, load_payload
+
+SCENARIOS = generate(load_payload())
+RESULTS = ResultsStore(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "results.jsonl")
+)
+# set SCENARIOS_RERUN=all to place calls for scenarios that already passed
+COVERED = (
+    set()
+    if os.environ.get("SCENARIOS_RERUN") == "all"
+    else covered(SCENARIOS, RESULTS.latest())
+)
+
+
+class TestScenarioMatrix(AIAgentTestCase):
+    """
+    Scenarios generated from the factor table in scenarios.json
+    """
+
+
+def scenario_test(scenario):
+    def test(self):
+        if scenario["test_id"] in COVERED:
+            self.skipTest("Passed in an earlier run, set SCENARIOS_RERUN=all to run again")
+        self.run_test(
+            test_id=scenario["test_id"],
+            shop_name=scenario["shop_name"],
+            services=scenario["services"],
+            vehicles_requirements=scenario["vehicles_requirements"],
+            available_time_ranges=scenario["available_time_ranges"],
+            payload=scenario["payload"],
+            expected_booking_success=scenario["expected_booking_success"],
+            fail_msg=scenario["fail_msg"],
+            expected_behavior=scenario["expected_behavior"],
+            valid_time_range=scenario["valid_time_range"],
+            additional_instructions=scenario.get("additional_instructions", ""),
+        )
+
+    test.__doc__ = scenario["test_id"] + ": " + ", ".join(scenario["levels"].values())
+    return test
+
+
+for scenario in SCENARIOS:
+    setattr(
+        TestScenarioMatrix,
+        "test_" + scenario["test_id"].replace("-", "_").lower(),
+        scenario_test(scenario),
+    )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from upstream import (  # noqa: E402
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    UpstreamGate,
+    UpstreamUnavailable,
+)
+
+
+class FakeClock:
+    """
+    Stands in for the time module in upstream, moving only when told to
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def gate(**kwargs):
+    options = dict(
+        max_limit=8,
+        latency_target=1,
+        failure_threshold=3,
+        open_timeout=30,
+        max_queue=10,
+        queue_timeout=0.05,
+    )
+    options.update(kwargs)
+    return UpstreamGate("test", **options)
+
+
+class TestUpstreamGate(unittest.TestCase):
+    """
+    Admission control in front of Bland, without any requests to Bland
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("upstream.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, upstream_gate, outcome, latency=0.1, retry_after=None):
+        upstream_gate.acquire()
+        upstream_gate.release(outcome, latency, retry_after)
+
+    def test_limit_is_halved_once_per_latency_target(self):
+        upstream_gate = gate()
+        self.send(upstream_gate, "overloaded")
+        self.assertEqual(upstream_gate.limit, 4)
+        # errors from requests sent together count as one decrease
+        self.send(upstream_gate, "failed")
+        self.assertEqual(upstream_gate.limit, 4)
+        self.clock.advance(1)
+        self.send(upstream_gate, "succeeded", latency=5)
+        self.assertEqual(upstream_gate.limit, 2)
+
+    def test_limit_grows_by_one_per_round_of_fast_responses(self):
+        upstream_gate = gate()
+        self.send(upstream_gate, "overloaded")
+        for _ in range(4):
+            self.send(upstream_gate, "succeeded")
+        self.assertAlmostEqual(upstream_gate.limit, 5, delta=0.2)
+        for _ in range(100):
+            self.send(upstream_gate, "succeeded")
+        self.assertEqual(upstream_gate.limit, 8)
+
+    def test_limit_never_drops_below_min_limit(self):
+        upstream_gate = gate(min_limit=2)
+        for _ in range(10):
+            self.send(upstream_gate, "overloaded")
+            self.clock.advance(1)
+        self.assertEqual(upstream_gate.limit, 2)
+
+    def test_in_flight_requests_are_capped_by_the_limit(self):
+        upstream_gate = gate(max_limit=2)
+        upstream_gate.acquire()
+        upstream_gate.acquire()
+        # a third request would have to wait for a slot
+        self.assertIsNotNone(upstream_gate._try_acquire())
+        upstream_gate.release("succeeded", 0.1)
+        upstream_gate.acquire()
+        self.assertEqual(upstream_gate.in_flight, 2)
+
+    def test_retry_after_holds_back_new_requests(self):
+        upstream_gate = gate()
+        self.send(upstream_gate, "overloaded", retry_after=5)
+        self.assertAlmostEqual(upstream_gate._try_acquire(), 5)
+        self.clock.advance(5)
+        self.assertIsNone(upstream_gate._try_acquire())
+
+    def test_circuit_opens_after_failure_threshold(self):
+        upstream_gate = gate()
+        for _ in range(3):
+            self.send(upstream_gate, "failed")
+            self.clock.advance(1)
+        self.assertEqual(upstream_gate.state, OPEN)
+        with self.assertRaises(UpstreamUnavailable) as raised:
+            upstream_gate.acquire()
+        # opened a second ago, for 30 seconds
+        self.assertEqual(raised.exception.retry_after, 30)
+
+    def test_success_resets_failures(self):
+        upstream_gate = gate()
+        self.send(upstream_gate, "failed")
+        self.send(upstream_gate, "failed")
+        self.send(upstream_gate, "succeeded")
+        self.send(upstream_gate, "failed")
+        self.assertEqual(upstream_gate.state, CLOSED)
+
+    def test_half_open_lets_a_single_probe_through(self):
+        upstream_gate = gate()
+        for _ in range(3):
+            self.send(upstream_gate, "failed")
+        self.clock.advance(30)
+        upstream_gate.acquire()
+        self.assertEqual(upstream_gate.state, HALF_OPEN)
+        self.assertIsNotNone(upstream_gate._try_acquire())
+        upstream_gate.release("succeeded", 0.1)
+        self.assertEqual(upstream_gate.state, CLOSED)
+        upstream_gate.acquire()
+        upstream_gate.acquire()
+
+    def test_failed_probe_opens_the_circuit_again(self):
+        upstream_gate = gate()
+        for _ in range(3):
+            self.send(upstream_gate, "failed")
+        self.clock.advance(30)
+        self.send(upstream_gate, "failed")
+        self.assertEqual(upstream_gate.state, OPEN)
+        with self.assertRaises(UpstreamUnavailable):
+            upstream_gate.acquire()
+
+    def test_interrupted_requests_only_free_their_slot(self):
+        upstream_gate = gate()
+        for _ in range(5):
+            self.send(upstream_gate, "interrupted")
+        self.assertEqual(upstream_gate.limit, 8)
+        self.assertEqual(upstream_gate.state, CLOSED)
+        self.assertEqual(upstream_gate.in_flight, 0)
+
+
+class TestUpstreamGateQueue(unittest.TestCase):
+    """
+    Requests waiting for a slot, with short real timeouts
+    """
+
+    def test_waiting_request_gets_the_freed_slot(self):
+        upstream_gate = gate(max_limit=1, queue_timeout=5)
+        upstream_gate.acquire()
+        acquired = threading.Event()
+        waiter = threading.Thread(
+            target=lambda: (upstream_gate.acquire(), acquired.set())
+        )
+        waiter.start()
+        time.sleep(0.05)
+        self.assertFalse(acquired.is_set())
+        upstream_gate.release("succeeded", 0.1)
+        waiter.join(1)
+        self.assertTrue(acquired.is_set())
+
+    def test_waiting_request_times_out(self):
+        upstream_gate = gate(max_limit=1, queue_timeout=0.05)
+        upstream_gate.acquire()
+        started_at = time.monotonic()
+        with self.assertRaises(UpstreamUnavailable):
+            upstream_gate.acquire()
+        self.assertLess(time.monotonic() - started_at, 1)
+        self.assertEqual(upstream_gate._waiting, 0)
+
+    def test_full_queue_rejects_right_away(self):
+        upstream_gate = gate(max_limit=1, max_queue=1, queue_timeout=5)
+        upstream_gate.acquire()
+        waiter = threading.Thread(target=upstream_gate.acquire)
+        waiter.start()
+        time.sleep(0.05)
+        started_at = time.monotonic()
+        with self.assertRaises(UpstreamUnavailable):
+            upstream_gate.acquire()
+        self.assertLess(time.monotonic() - started_at, 1)
+        upstream_gate.release("succeeded", 0.1)
+        waiter.join(1)
+
+    def test_async_waiter_is_woken_by_release(self):
+        upstream_gate = gate(max_limit=1, queue_timeout=5)
+        upstream_gate.acquire()
+
+        def release():
+            time.sleep(0.05)
+            upstream_gate.release("succeeded", 0.1)
+
+        async def wait_for_slot():
+            threading.Thread(target=release).start()
+            started_at = time.monotonic()
+            await upstream_gate.acquire_async()
+            return time.monotonic() - started_at
+
+        self.assertLess(asyncio.run(wait_for_slot()), 1)
+        self.assertEqual(upstream_gate.in_flight, 1)
+
+    def test_async_waiter_times_out(self):
+        upstream_gate = gate(max_limit=1, queue_timeout=0.05)
+        upstream_gate.acquire()
+        with self.assertRaises(UpstreamUnavailable):
+            asyncio.run(upstream_gate.acquire_async())
+        self.assertEqual(upstream_gate._waiting, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# "assistant: ...", "user: ...", "agent-action: ..." at the start of a line
+TURN_PATTERN = re.compile(r"^\s*([\w-]+):\s?(.*)$")
+# Hesitations that carry no meaning on their own ("uh-huh" and "mhm" mean yes)
+FILLER_PATTERN = re.compile(
+    r"\b(?:u+h+(?![\s-]*hu+h)|u+m+|h+m+|e+r+m*)\b[,.]?\s*", re.IGNORECASE
+)
+# Room left for the "[... N turns omitted ...]" marker
+MARKER_TOKENS = 10
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """
+    Approximate token count: words and punctuation marks, which tracks GPT
+    tokenizers closely for English conversations
+    """
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def parse_turns(transcript):
+    """
+    Split a concatenated transcript into (speaker, text) turns
+    """
+    turns = []
+    for line in transcript.splitlines():
+        match = TURN_PATTERN.match(line)
+        if match:
+            turns.append([match.group(1), match.group(2).strip()])
+        elif turns and line.strip():
+            turns[-1][1] = f"{turns[-1][1]} {line.strip()}".strip()
+    return turns
+
+
+def compact_turns(turns):
+    """
+    Drop hesitations and empty turns, then merge consecutive turns of the same
+    speaker, skipping sentences they just repeated
+    """
+    compacted = []
+    for speaker, text in turns:
+        text = FILLER_PATTERN.sub("", text).strip()
+        if not text.strip(" .,?!-"):
+            continue
+        if compacted and compacted[-1][0] == speaker:
+            if text != compacted[-1][1] and not compacted[-1][1].endswith(text):
+                compacted[-1][1] = f"{compacted[-1][1]} {text}"
+            continue
+        compacted.append([speaker, text])
+    return compacted
+
+
+def fit_to_budget(lines, budget):
+    """
+    Keep the first and last lines of the conversation within budget tokens,
+    replacing the middle with a marker. The opening (which shop, which
+    vehicle) and the ending (the booking and the driver's details) are what
+    the verdict depends on most.
+    """
+    costs = [count_tokens(line) for line in lines]
+    if not budget or sum(costs) <= budget:
+        return lines
+    budget = max(0, budget - MARKER_TOKENS)
+    head_budget = budget // 3
+    head, used = 0, 0
+    while head < len(lines) and used + costs[head] <= head_budget:
+        used += costs[head]
+        head += 1
+    tail, tail_used = len(lines), 0
+    while tail > head and used + tail_used + costs[tail - 1] <= budget:
+        tail -= 1
+        tail_used += costs[tail]
+    omitted = tail - head
+    return lines[:head] + [f"[... {omitted} turns omitted ...]"] + lines[tail:]
+
+
+class TranscriptCompactor:
+    """
+    Compacts transcripts before they are judged, remembering the compacted
+    form of the last max_entries calls by call_id
+    """
+
+    def __init__(self, budget=3000, max_entries=1000):
+        self.budget = budget
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def compact(self, call_id, transcript):
+        """
+        The transcript without hesitations and repeats, trimmed to the token budget
+        """
+        digest = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._entries.get(call_id)
+            if entry and entry[0] == digest:
+                self._entries.move_to_end(call_id)
+                return entry[1]
+
+        lines = [
+            f"{speaker}: {text}" for speaker, text in compact_turns(parse_turns(transcript))
+        ]
+        # not a transcript we know how to read, judge it as it is
+        compacted = " \n".join(fit_to_budget(lines, self.budget)) if lines else transcript
+
+        with self._lock:
+            self._entries[call_id] = (digest, compacted)
+            self._entries.move_to_end(call_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compacted
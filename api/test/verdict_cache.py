@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class VerdictCache:
+    """
+    On-disk cache of LLM verdicts keyed by a hash of everything sent to the model.
+    Entries older than max_age seconds are ignored and the oldest entries are
+    removed once there are more than max_entries.
+    """
+
+    def __init__(self, path, max_entries=10000, max_age=30 * 24 * 60 * 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        os.makedirs(self.path, exist_ok=True)
+        self._entries = self.evict()
+
+    def key(self, system_prompt, user_content, deployment_name):
+        """
+        Hash of the system prompt, the rendered user content and the deployment name
+        """
+        digest = hashlib.sha256()
+        for part in (system_prompt, user_content, deployment_name):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached verdict for key, or None if missing or expired
+        """
+        entry_path = os.path.join(self.path, key + ".json")
+        try:
+            if time.time() - os.path.getmtime(entry_path) > self.max_age:
+                os.remove(entry_path)
+                return None
+            with open(entry_path, "r", encoding="UTF-8") as f:
+                return json.load(f)["verdict"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, verdict):
+        """
+        Cache the verdict for key
+        """
+        entry_path = os.path.join(self.path, key + ".json")
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="UTF-8") as f:
+            f.write(json.dumps({"verdict": verdict, "created_at": time.time()}))
+        os.replace(tmp_path, entry_path)
+        self._entries += 1
+        if self._entries > self.max_entries:
+            self._entries = self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries and the oldest ones beyond max_entries, returning
+        how many entries are left
+        """
+        now = time.time()
+        entries = []
+        for file_name in os.listdir(self.path):
+            entry_path = os.path.join(self.path, file_name)
+            try:
+                mtime = os.path.getmtime(entry_path)
+                if now - mtime > self.max_age:
+                    os.remove(entry_path)
+                else:
+                    entries.append((mtime, entry_path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, entry_path in entries[: max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+        return min(len(entries), self.max_entries)